@@ -2,14 +2,17 @@ import streamlit as st
 import geopandas as gpd
 import pandas as pd
 import folium
-from streamlit_folium import st_folium
+import streamlit.components.v1 as components
 import plotly.express as px
 import rasterio
 import numpy as np
 from rasterio.plot import show
 from PIL import Image
 import os
+import json
 import base64
+import pyarrow as pa
+from io import BytesIO
 from pathlib import Path
 
 
@@ -73,6 +76,16 @@ if anio_inicio > anio_fin:
 # -------------------------------------------------
 # CARGA DE DATOS
 # -------------------------------------------------
+def _leer_reporte(ruta, columns=None) -> pd.DataFrame:
+    # Reporte Arrow IPC (scripts/convert_reports.py) leído con mmap: el SO sirve
+    # las páginas desde su caché y las columnas numéricas no se copian ni decodifican
+    with pa.memory_map(str(ruta), "r") as src:
+        tabla = pa.ipc.open_file(src).read_all()
+    if columns is not None:
+        tabla = tabla.select(columns)
+    return tabla.to_pandas()
+
+
 @st.cache_data
 def cargar_datos():
     # Carpeta base: el directorio donde está app.py
@@ -82,21 +95,65 @@ def cargar_datos():
     reports_dir = base_dir / "utils" / "outputs" / "reports"
     vector_dir = base_dir / "utils" / "data" / "vector"
 
-    # CSVs
-    cambios_zona = pd.read_csv(reports_dir / "04_cambios_por_zona.csv")
-    superficies = pd.read_csv(reports_dir / "02_superficies_clasificadas.csv")
-    estadisticas = pd.read_csv(reports_dir / "02_estadisticas_anuales.csv")
-    matriz_conf = pd.read_csv(reports_dir / "03_matriz_confusion.csv")
+    # Reportes (Arrow IPC generado con scripts/convert_reports.py)
+    # superficies se lee completo porque se grafica y se ofrece para descarga.
+    # cambios_zona no se carga aquí: sus totales vienen en indicadores.json
+    superficies = _leer_reporte(reports_dir / "02_superficies_clasificadas.arrow")
+    estadisticas = _leer_reporte(
+        reports_dir / "02_estadisticas_anuales.arrow",
+        columns=["Año", "Índice", "Media", "Std"]
+    )
+    matriz_conf = _leer_reporte(reports_dir / "03_matriz_confusion.arrow")
+
+    # Archivos espaciales (GeoParquet)
+    limite = gpd.read_parquet(vector_dir / "limite_comuna.parquet")
+
+    # Red vial y manzanas: solo las geometrías dentro de la extensión del límite comunal
+    bbox_comuna = tuple(limite.total_bounds)
+    red_vial = gpd.read_parquet(vector_dir / "red_vial.parquet", bbox=bbox_comuna)
+
+    # Red vial: quedarse solo con las columnas relevantes y luego convertirlas a texto
+    red_vial = red_vial[["highway", "name", "geometry"]].astype({"highway": "string", "name": "string"})
+    # Manzanas: solo la geometría (el mapa no usa popups ni tooltips, y cada atributo
+    # se serializaría en el GeoJSON enviado al navegador)
+    manzanas_censales = gpd.read_parquet(
+        vector_dir / "manzanas_censales.parquet",
+        columns=["geometry"],
+        bbox=bbox_comuna
+    )
+
+    # Simplificar manzanas (tolerancia 5 m, CRS métrico) antes de enviarlas al navegador
+    manzanas_censales["geometry"] = manzanas_censales.geometry.simplify(5, preserve_topology=True)
+
+    # Reproyectar una sola vez a WGS84 (EPSG:4326), el CRS que usa folium.
+    # Las capas solo se usan en el mapa, por lo que se devuelven ya reproyectadas
+    limite_wgs = limite.to_crs(epsg=4326)
+    red_vial_wgs = red_vial.to_crs(epsg=4326)
+    manzanas_wgs = manzanas_censales.to_crs(epsg=4326)
+
+    # Estadísticas separadas por índice (NDVI, NDBI, NDWI, BSI) para búsqueda directa
+    por_indice = {
+        k: v.drop(columns="Índice")
+        for k, v in estadisticas.groupby("Índice", sort=False)
+    }
 
-    # Archivos espaciales
-    limite = gpd.read_file(vector_dir / "limite_comuna.gpkg")
-    red_vial = gpd.read_file(vector_dir / "red_vial.geojson")
-    manzanas_censales = gpd.read_file(vector_dir / "manzanas_censales.shp", engine="fiona")
+    return superficies, por_indice, matriz_conf, limite_wgs, red_vial_wgs, manzanas_wgs
 
-    return cambios_zona, superficies, estadisticas, matriz_conf, limite, red_vial, manzanas_censales
+@st.cache_data
+def indicadores() -> dict:
+    # Totales y promedios por zona precalculados (scripts/convert_reports.py)
+    ruta = Path(__file__).resolve().parent / "utils" / "outputs" / "reports" / "indicadores.json"
+    return json.loads(ruta.read_text(encoding="utf-8"))
+
+@st.cache_data
+def cargar_cambios_zona() -> pd.DataFrame:
+    # Tabla completa por zona: solo se lee si el usuario prepara su descarga
+    ruta = Path(__file__).resolve().parent / "utils" / "outputs" / "reports" / "04_cambios_por_zona.arrow"
+    return _leer_reporte(ruta)
 
 # Llamada
-cambios_zona, superficies, estadisticas, matriz_conf, limite, red_vial, manzanas_censales = cargar_datos()
+superficies, por_indice, matriz_conf, limite_wgs, red_vial_wgs, manzanas_wgs = cargar_datos()
+ind = indicadores()
 
 
 # -------------------------------------------------
@@ -107,39 +164,23 @@ col1, col2 = st.columns([2, 1])
 # -------------------------------------------------
 # MAPA INTERACTIVO
 # -------------------------------------------------
-with col1:
-    st.subheader("🗺️ Mapa de referencia territorial")
-    st.markdown(
-        """
-        Este mapa muestra el límite comunal de Viña del Mar y su red vial principal.
-        Sirve como referencia espacial para ubicar los cambios detectados en los análisis.
-        """
-    )
+@st.cache_data
+def centro_comuna(_limite_wgs):
+    # Unión de geometrías + un único centroide (el límite es estático)
+    c = _limite_wgs.geometry.union_all().centroid
+    return [c.y, c.x]
 
-    limite_wgs = limite.to_crs(epsg=4326)
-    red_vial_wgs = red_vial.to_crs(epsg=4326)
 
-    centro = [
-        limite_wgs.geometry.centroid.y.mean(),
-        limite_wgs.geometry.centroid.x.mean()
-    ]
+@st.cache_resource
+def construir_mapa(_limite_wgs, _red_vial_wgs, _manzanas_wgs):
+    # Se construye una sola vez por proceso: los datos son estáticos
+    # (las capas llegan ya en EPSG:4326 desde cargar_datos)
+    centro = centro_comuna(_limite_wgs)
 
     m = folium.Map(location=centro, zoom_start=12, tiles="cartodbpositron")
 
-    # --- LIMPIEZA DE RED VIAL PARA FOLIUM ---
-    red_vial_wgs = red_vial_wgs.copy()
-
-    # Convertir todo a string excepto geometría
-    for col in red_vial_wgs.columns:
-        if col != "geometry":
-            red_vial_wgs[col] = red_vial_wgs[col].astype(str)
-
-    # (opcional) quedarte solo con columnas relevantes
-    red_vial_wgs = red_vial_wgs[["highway", "name", "geometry"]]
-
-
     folium.GeoJson(
-        limite_wgs,
+        _limite_wgs,
         name="Límite comunal",
         style_function=lambda x: {
             "fillOpacity": 0.1,
@@ -149,7 +190,7 @@ with col1:
     ).add_to(m)
 
     folium.GeoJson(
-        red_vial_wgs,
+        _red_vial_wgs,
         name="Red vial",
         style_function=lambda x: {
             "color": "gray",
@@ -158,17 +199,36 @@ with col1:
     ).add_to(m)
 
     folium.GeoJson(
-    manzanas_censales,
-    name="Manzanas censales",
-    style_function=lambda x: {
-        "fillColor": "#9D664A00",
-        "color": "red",
-        "weight": 0.5
-    }
-).add_to(m)
+        _manzanas_wgs,
+        name="Manzanas censales",
+        style_function=lambda x: {
+            "fillColor": "#9D664A00",
+            "color": "red",
+            "weight": 0.5
+        }
+    ).add_to(m)
 
     folium.LayerControl().add_to(m)
-    st_folium(m, height=500, width=800)
+    return m
+
+
+@st.cache_data
+def mapa_html(_m) -> str:
+    # HTML final del mapa (plantillas JS + GeoJSON serializado), renderizado una vez
+    return _m.get_root().render()
+
+
+with col1:
+    st.subheader("🗺️ Mapa de referencia territorial")
+    st.markdown(
+        """
+        Este mapa muestra el límite comunal de Viña del Mar y su red vial principal.
+        Sirve como referencia espacial para ubicar los cambios detectados en los análisis.
+        """
+    )
+
+    m = construir_mapa(limite_wgs, red_vial_wgs, manzanas_wgs)
+    components.html(mapa_html(m), height=500, width=800)
 
 # -------------------------------------------------
 # MÉTRICAS CLAVE
@@ -178,16 +238,16 @@ with col2:
     st.caption("Resumen global del periodo completo analizado (no depende de la selección de años).")
 
     # --- Totales en hectáreas por tipo de cambio ---
-    urb_ha = cambios_zona["urbanizacion_ha"].sum()
-    perd_veg_ha = cambios_zona["perdida_veg_ha"].sum()
-    gan_veg_ha = cambios_zona["ganancia_veg_ha"].sum()
-    agua_ha = cambios_zona["nuevo_agua_ha"].sum()
+    urb_ha = ind["urb_ha"]
+    perd_veg_ha = ind["perd_veg_ha"]
+    gan_veg_ha = ind["gan_veg_ha"]
+    agua_ha = ind["agua_ha"]
 
     # --- Cambio neto de vegetación ---
     cambio_neto_veg = gan_veg_ha - perd_veg_ha
 
     # --- Área total analizada y % con cambios ---
-    area_total_analizada = cambios_zona["total_pixeles"].sum() * 0.01
+    area_total_analizada = ind["total_pixeles"] * 0.01
     area_total_cambiada = urb_ha + perd_veg_ha + gan_veg_ha + agua_ha
     pct_territorio_cambiado = 100 * area_total_cambiada / area_total_analizada
 
@@ -202,9 +262,9 @@ with col2:
     valor_dom = totales[proceso_dominante]
 
     # --- Promedios porcentuales por zona ---
-    promedio_urb_pct = cambios_zona["urbanizacion_pct"].mean()
-    promedio_perd_veg_pct = cambios_zona["perdida_veg_pct"].mean()
-    promedio_gan_veg_pct = cambios_zona["ganancia_veg_pct"].mean()
+    promedio_urb_pct = ind["promedio_urb_pct"]
+    promedio_perd_veg_pct = ind["promedio_perd_veg_pct"]
+    promedio_gan_veg_pct = ind["promedio_gan_veg_pct"]
 
     # --- Layout de métricas ---
     with st.container():
@@ -280,10 +340,10 @@ st.markdown(
     """
 )
 
-df_idx = estadisticas[
-    (estadisticas["Índice"] == indice_sel) &
-    (estadisticas["Año"] >= anio_inicio) &
-    (estadisticas["Año"] <= anio_fin)
+df_idx = por_indice[indice_sel]
+df_idx = df_idx[
+    (df_idx["Año"] >= anio_inicio) &
+    (df_idx["Año"] <= anio_fin)
 ]
 
 
@@ -313,17 +373,24 @@ st.markdown(
     """
 )
 
+@st.cache_data
+def _png_bytes(ruta: str) -> bytes:
+    # Miniaturas generadas con scripts/crear_miniaturas.py
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
 col3, col4 = st.columns(2)
 
 with col3:
     st.image(
-        f"app/utils/outputs/figures/02_mapa_indices_{anio_inicio}.png",
+        _png_bytes(f"app/utils/outputs/figures/02_mapa_indices_{anio_inicio}_thumb.png"),
         caption=f"{indice_sel} – {anio_inicio}"
     )
 
 with col4:
     st.image(
-        f"app/utils/outputs/figures/02_mapa_indices_{anio_fin}.png",
+        _png_bytes(f"app/utils/outputs/figures/02_mapa_indices_{anio_fin}_thumb.png"),
         caption=f"{indice_sel} – {anio_fin}"
     )
 
@@ -352,13 +419,17 @@ st.image(
 )
 
 
+@st.cache_data
+def _gif_b64(ruta: str) -> str:
+    # Lectura + codificación base64 una sola vez (clave de caché: la ruta)
+    with open(ruta, "rb") as f:
+        return base64.b64encode(f.read()).decode()
+
+
 def mostrar_gif(ruta_gif):
-    with open(ruta_gif, "rb") as f:
-        data = f.read()
-    encoded = base64.b64encode(data).decode()
     st.markdown(
         f"""
-        <img src="data:image/gif;base64,{encoded}" 
+        <img src="data:image/gif;base64,{_gif_b64(ruta_gif)}" 
             style="width:100%; max-width:1200px;">
         """,
         unsafe_allow_html=True
@@ -377,24 +448,55 @@ mostrar_gif("app/utils/outputs/figures/animacion_NDVI.gif")
 # -------------------------------------------------
 # DESCARGA DE RESULTADOS
 # -------------------------------------------------
+@st.cache_data
+def _to_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode()
+
+
+@st.cache_data
+def _to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    buffer = BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
 st.sidebar.markdown("---")
 st.sidebar.subheader("⬇️ Descarga de resultados")
 st.sidebar.markdown(
-    "Puedes descargar los datos procesados para análisis externo en CSV."
+    "Puedes descargar los datos procesados para análisis externo en CSV o Parquet."
 )
 
-csv_zonas = cambios_zona.to_csv(index=False)
-st.sidebar.download_button(
-    "Descargar cambios por zona",
-    csv_zonas,
-    "cambios_por_zona.csv",
-    "text/csv"
-)
+# Cambios por zona: la tabla se carga solo cuando el usuario lo solicita
+if st.sidebar.button("Preparar cambios por zona"):
+    st.session_state["cambios_zona_listo"] = True
+
+if st.session_state.get("cambios_zona_listo", False):
+    cambios_zona = cargar_cambios_zona()
+
+    st.sidebar.download_button(
+        "Descargar cambios por zona",
+        _to_csv_bytes(cambios_zona),
+        "cambios_por_zona.csv",
+        "text/csv"
+    )
+
+    st.sidebar.download_button(
+        "Descargar cambios por zona (Parquet)",
+        _to_parquet_bytes(cambios_zona),
+        "cambios_por_zona.parquet",
+        "application/vnd.apache.parquet"
+    )
 
-csv_sup = superficies.to_csv(index=False)
 st.sidebar.download_button(
     "Descargar superficies clasificadas",
-    csv_sup,
+    _to_csv_bytes(superficies),
     "superficies_clasificadas.csv",
     "text/csv"
 )
+
+st.sidebar.download_button(
+    "Descargar superficies clasificadas (Parquet)",
+    _to_parquet_bytes(superficies),
+    "superficies_clasificadas.parquet",
+    "application/vnd.apache.parquet"
+)
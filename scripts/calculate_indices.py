@@ -6,16 +6,32 @@
 #              diferentes tipos de cobertura del suelo (vegetación, áreas urbanas,
 #              cuerpos de agua y suelo desnudo).
 #
-# Uso: python scripts/calculate_indices.py
+# Uso: python scripts/calculate_indices.py [--int16] [--gpu]
+#      --int16: guarda los índices como enteros int16 escalados (x10000) en vez
+#               de float32. Archivos más chicos; los consumidores deben aplicar
+#               la escala de la banda (src.scales), como hace detect_changes.py
+#      --gpu:   calcula los índices en GPU con CuPy (opcional, si está instalado)
 # =============================================================================
 
 # 1) Importación de librerías
+import argparse          # Procesamiento de argumentos de línea de comandos
 import rasterio          # Lectura y escritura de archivos raster (GeoTIFF)
 import numpy as np       # Operaciones numéricas con arrays multidimensionales
+import os                # Número de CPUs para el pool de hilos
 import warnings          # Control de mensajes de advertencia del sistema
 from pathlib import Path # Manejo moderno de rutas de archivos multiplataforma
 from datetime import datetime  # Registro de fecha y hora para metadatos
 from tqdm import tqdm    # Barras de progreso visual en bucles
+from numba import njit  # Compilación JIT del kernel numérico (sin GIL)
+from threading import Lock  # Acceso exclusivo a los archivos raster entre hilos
+from concurrent.futures import ThreadPoolExecutor  # Procesamiento paralelo por bloques
+from concurrent.futures import ProcessPoolExecutor, as_completed  # Procesamiento paralelo por año
+
+# CuPy es opcional: solo se usa con --gpu si hay una GPU CUDA disponible
+try:
+    import cupy as cp    # Arrays en GPU con la misma API que NumPy
+except ImportError:
+    cp = None
 
 # 2) Configuración de advertencias
 # Ignorar advertencias de división por cero (las manejamos manualmente con NaN)
@@ -35,19 +51,40 @@ PROCESSED_DIR = BASE_DIR / "data" / "processed"
 # Archivo de metadatos para documentar el procesamiento
 METADATA_FILE = PROCESSED_DIR / "metadata.txt"
 
+# Opciones de GDAL para la lectura/escritura de rasters: decodificación
+# multihilo y 512 MB de caché de bloques
+GDAL_ENV = {"GDAL_NUM_THREADS": "ALL_CPUS", "GDAL_CACHEMAX": 512}
+
+# Salida opcional en int16: valor guardado = round(índice * 10000)
+ESCALA_INT16 = 0.0001   # Factor para volver a unidades reales (src.scales)
+NODATA_INT16 = -32768   # Valor reservado para píxeles sin datos
+
 # 4) Crear carpeta de salida si no existe
 PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
 
-# 5) Inicialización del archivo de metadatos
-# Se sobrescribe en cada ejecución para mantener registro actualizado
-with open(METADATA_FILE, "w", encoding="utf-8") as f:
-    f.write(f"METADATOS DE ÍNDICES ESPECTRALES (PROCESSED)\n")
-    f.write(f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-    f.write("="*50 + "\n\n")
+# 5) Funciones auxiliares
+
+def iniciar_metadata():
+    """
+    Inicializa el archivo de metadatos con su encabezado.
+
+    Descripción:
+        Se sobrescribe en cada ejecución para mantener registro actualizado.
+        Se llama solo desde el bloque principal: los procesos del pool
+        importan este módulo y no deben truncar el archivo.
 
-# 6) Funciones auxiliares
+    Entradas:
+        None
+
+    Salidas:
+        None: La función escribe directamente en el archivo metadata.txt
+    """
+    with open(METADATA_FILE, "w", encoding="utf-8") as f:
+        f.write(f"METADATOS DE ÍNDICES ESPECTRALES (PROCESSED)\n")
+        f.write(f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write("="*50 + "\n\n")
 
-def log_metadata(filename, year, stats):
+def log_metadata(filename, year, stats, fh):
     """
     Registra las estadísticas de procesamiento en el archivo de metadatos.
     
@@ -61,23 +98,241 @@ def log_metadata(filename, year, stats):
         year (str): Año correspondiente a la imagen procesada
         stats (dict): Diccionario con estadísticas promedio de cada índice:
                       {'ndvi': float, 'ndbi': float, 'ndwi': float, 'bsi': float}
+        fh (file): Manejador de metadata.txt abierto en modo append; se abre una
+                   sola vez en el bloque principal para todas las imágenes
     
     Salidas:
         None: La función escribe directamente en el archivo metadata.txt
     """
-    # Abrir archivo en modo append para agregar sin sobrescribir
-    with open(METADATA_FILE, "a", encoding="utf-8") as f:
-        f.write(f"Archivo: {filename}\n")                    # Nombre del archivo generado
-        f.write(f" - Año: {year}\n")                         # Año de la imagen
-        f.write(f" - Bandas: 1:NDVI, 2:NDBI, 3:NDWI, 4:BSI\n") # Orden de bandas en el archivo
-        f.write(f" - Estadísticas (Promedio):\n")            # Encabezado de estadísticas
-        f.write(f"   * NDVI: {stats['ndvi']:.3f}\n")         # Promedio de vegetación
-        f.write(f"   * NDBI: {stats['ndbi']:.3f}\n")         # Promedio de construcciones
-        f.write(f"   * NDWI: {stats['ndwi']:.3f}\n")         # Promedio de agua
-        f.write(f"   * BSI:  {stats['bsi']:.3f}\n")          # Promedio de suelo desnudo
-        f.write("-" * 30 + "\n")                             # Separador visual
+    # Se arma el bloque completo y se escribe con una sola llamada
+    fh.write("\n".join([
+        f"Archivo: {filename}",                     # Nombre del archivo generado
+        f" - Año: {year}",                          # Año de la imagen
+        f" - Bandas: 1:NDVI, 2:NDBI, 3:NDWI, 4:BSI", # Orden de bandas en el archivo
+        f" - Estadísticas (Promedio):",             # Encabezado de estadísticas
+        f"   * NDVI: {stats['ndvi']:.3f}",          # Promedio de vegetación
+        f"   * NDBI: {stats['ndbi']:.3f}",          # Promedio de construcciones
+        f"   * NDWI: {stats['ndwi']:.3f}",          # Promedio de agua
+        f"   * BSI:  {stats['bsi']:.3f}",           # Promedio de suelo desnudo
+        "-" * 30,                                   # Separador visual
+    ]) + "\n")
+
+# --- Kernel fusionado de índices espectrales ---
+# Aritmética en float64 (como el cálculo NumPy original) y sin fastmath: 'arcp',
+# 'afn' y 'reassoc' alteran divisiones y sumas, y los índices se comparan luego
+# contra umbrales, por lo que un ulp de diferencia puede cambiar la clase de un
+# píxel. Solo la salida se guarda en float32.
+# nogil=True libera el GIL: el paralelismo se obtiene procesando varios
+# bloques de la imagen a la vez desde un pool de hilos (ver calcular_indices)
+@njit(nogil=True, cache=True)
+def _kernel_indices(bandas, factor, out):
+    """
+    Calcula NDVI, NDBI, NDWI y BSI recorriendo cada píxel una sola vez.
+
+    Descripción:
+        Reemplaza las expresiones NumPy por índice (que crean varios arrays
+        temporales y recorren la imagen múltiples veces) por un único bucle
+        sobre los píxeles de un bloque. Las bandas llegan en su tipo original
+        (uint16 en DN o float en reflectancia) y se normalizan dentro del
+        bucle (en float64), sin una pasada ni un array temporal extra por bloque.
+        Los píxeles donde todas las bandas son 0 (sin datos) se marcan
+        como NaN en los 4 índices.
+        En la misma pasada se acumulan sumas y conteos de valores válidos
+        del bloque, para obtener los promedios sin volver a recorrer los arrays.
+
+    Entradas:
+        bandas (np.array 3D): Bloque (5, alto, ancho) con Blue, Green, Red, NIR, SWIR1
+        factor (float): Factor de escala (10000 o 1)
+        out (np.array 3D float32): Salida preasignada (4, alto, ancho):
+                                   NDVI, NDBI, NDWI, BSI
+
+    Salidas:
+        tuple: (sumas, conteos) con forma (4,); orden NDVI, NDBI, NDWI, BSI
+    """
+    eps = 1e-10  # Evita divisiones por cero
+    _, alto, ancho = bandas.shape
+    sumas = np.zeros(4, dtype=np.float64)   # Acumulado en float64 (precisión)
+    conteos = np.zeros(4, dtype=np.int64)   # Píxeles válidos (no NaN)
+    for i in range(alto):
+        for j in range(ancho):
+            # Normalización a reflectancia (0-1) en float64
+            b = np.float64(bandas[0, i, j]) / factor
+            g = np.float64(bandas[1, i, j]) / factor
+            r = np.float64(bandas[2, i, j]) / factor
+            n = np.float64(bandas[3, i, j]) / factor
+            s = np.float64(bandas[4, i, j]) / factor
+
+            # Píxel sin datos: todas las bandas en 0
+            if b + g + r + n + s == 0:
+                out[0, i, j] = np.nan
+                out[1, i, j] = np.nan
+                out[2, i, j] = np.nan
+                out[3, i, j] = np.nan
+                continue
+
+            v0 = (n - r) / (n + r + eps)                           # Vegetación
+            v1 = (s - n) / (s + n + eps)                           # Construcciones
+            v2 = (g - n) / (g + n + eps)                           # Agua
+            v3 = ((s + r) - (n + b)) / ((s + r) + (n + b) + eps)   # Suelo desnudo
+            out[0, i, j] = v0
+            out[1, i, j] = v1
+            out[2, i, j] = v2
+            out[3, i, j] = v3
+
+            # Acumular solo valores válidos (v == v es falso para NaN)
+            if v0 == v0:
+                sumas[0] += v0
+                conteos[0] += 1
+            if v1 == v1:
+                sumas[1] += v1
+                conteos[1] += 1
+            if v2 == v2:
+                sumas[2] += v2
+                conteos[2] += 1
+            if v3 == v3:
+                sumas[3] += v3
+                conteos[3] += 1
+    return sumas, conteos
+
+@njit(nogil=True, cache=True)
+def _cuantizar_int16(indices, out):
+    """
+    Convierte un bloque de índices float32 a int16 escalado (x10000).
+
+    Descripción:
+        Redondea índice * 10000 y lo satura a [-32767, 32767]; los NaN se
+        guardan como NODATA_INT16 (-32768). Opera sobre un bloque ya
+        calculado, que aún está en caché.
+
+    Entradas:
+        indices (np.array 3D float32): Bloque (4, alto, ancho) de índices
+        out (np.array 3D int16): Salida preasignada de la misma forma
+
+    Salidas:
+        None: Escribe los resultados directamente en out
+    """
+    nb, alto, ancho = indices.shape
+    for k in range(nb):
+        for i in range(alto):
+            for j in range(ancho):
+                v = indices[k, i, j]
+                if v != v:  # NaN -> sin datos
+                    out[k, i, j] = -32768
+                else:
+                    q = np.round(v * 10000.0)
+                    out[k, i, j] = np.int16(min(32767.0, max(-32767.0, q)))
+
+def _indices_xp(xp, bandas, factor):
+    """
+    Calcula los 4 índices de un bloque con operaciones de array (NumPy o CuPy).
+
+    Descripción:
+        Versión vectorizada del kernel, parametrizada por el módulo de arrays
+        (xp = numpy o cupy), usada para la ejecución en GPU. Aplica las
+        mismas reglas que _kernel_indices: normalización, NaN en píxeles sin
+        datos y sumas/conteos de valores válidos.
+
+    Entradas:
+        xp (module): numpy o cupy
+        bandas (xp.ndarray 3D): Bloque (5, alto, ancho) con Blue, Green, Red, NIR, SWIR1
+        factor (float): Factor de escala (10000 o 1)
+
+    Salidas:
+        tuple: (indices, sumas, conteos)
+            - indices (xp.ndarray 3D float32): (4, alto, ancho) NDVI, NDBI, NDWI, BSI
+            - sumas, conteos (xp.ndarray): Acumulados por índice, forma (4,)
+    """
+    eps = 1e-10
+    b, g, r, n, s = (bandas[k].astype(xp.float64) / factor for k in range(5))
+    sin_datos = (b + g + r + n + s) == 0
+
+    indices = xp.empty((4,) + b.shape, dtype=xp.float32)
+    indices[0] = (n - r) / (n + r + eps)                           # Vegetación
+    indices[1] = (s - n) / (s + n + eps)                           # Construcciones
+    indices[2] = (g - n) / (g + n + eps)                           # Agua
+    indices[3] = ((s + r) - (n + b)) / ((s + r) + (n + b) + eps)   # Suelo desnudo
+    indices[:, sin_datos] = xp.nan
+
+    validos = ~xp.isnan(indices)
+    sumas = xp.where(validos, indices, 0).sum(axis=(1, 2), dtype=xp.float64)
+    conteos = validos.sum(axis=(1, 2))
+    return indices, sumas, conteos
+
+def _procesar_bloque(src, dst, window, factor, lock_lectura, lock_escritura, int16=False, gpu=False):
+    """
+    Lee, calcula y escribe los índices de una ventana (bloque) de la imagen.
+
+    Descripción:
+        Los manejadores de rasterio no son seguros entre hilos, por lo que la
+        lectura y la escritura se serializan con locks; el cálculo (kernel
+        Numba sin GIL) sí se ejecuta en paralelo entre bloques.
+
+    Entradas:
+        src (DatasetReader): Imagen Sentinel-2 abierta para lectura
+        dst (DatasetWriter): Archivo de índices abierto para escritura
+        window (Window): Ventana a procesar
+        factor (float): Factor de escala (10000 o 1)
+        lock_lectura, lock_escritura (threading.Lock): Locks de acceso a src/dst
+        int16 (bool): Si es True, escribe el bloque cuantizado a int16 (x10000)
+        gpu (bool): Si es True, calcula el bloque en GPU con CuPy
+
+    Salidas:
+        tuple: (sumas, conteos) parciales del bloque, forma (4,)
+    """
+    # Bandas 1-5 (Blue, Green, Red, NIR, SWIR1) en su tipo original (uint16 en DN
+    # ocupa la mitad que float32); la normalización se hace dentro del kernel
+    with lock_lectura:
+        bandas = src.read([1, 2, 3, 4, 5], window=window)
 
-def calcular_indices(ruta_imagen, ruta_salida):
+    # Salida del bloque: 4 bandas (1:NDVI, 2:NDBI, 3:NDWI, 4:BSI)
+    if gpu:
+        # Copia del bloque a la GPU, cálculo vectorizado y copia de vuelta
+        indices, sumas, conteos = _indices_xp(cp, cp.asarray(bandas), factor)
+        indices, sumas, conteos = cp.asnumpy(indices), cp.asnumpy(sumas), cp.asnumpy(conteos)
+    else:
+        indices = np.empty((4,) + bandas.shape[1:], dtype=np.float32)
+        sumas, conteos = _kernel_indices(bandas, factor, indices)
+
+    # Las estadísticas se calculan sobre los valores float, antes de cuantizar
+    if int16:
+        salida = np.empty(indices.shape, dtype=np.int16)
+        _cuantizar_int16(indices, salida)
+        indices = salida
+
+    with lock_escritura:
+        dst.write(indices, window=window)
+    return sumas, conteos
+
+def _factor_escala(src):
+    """
+    Determina el factor para normalizar las bandas a reflectancia (0-1).
+
+    Descripción:
+        Usa solo metadatos del raster, sin leer píxeles (una muestra de la
+        esquina podía caer en zona sin datos y no detectar la escala):
+        1. Si el productor declaró una escala en la banda (src.scales), se usa
+           su inverso (ej: escala 0.0001 -> factor 10000).
+        2. Bandas enteras (uint16/int16) son DN de Sentinel-2 -> 10000.
+        3. Bandas float: reflectancia (1.0), salvo que las estadísticas de
+           GDAL guardadas en el archivo indiquen valores > 1.5 (DN en float).
+
+    Entradas:
+        src (DatasetReader): Imagen Sentinel-2 abierta para lectura
+
+    Salidas:
+        float: Factor de normalización (10000.0 o 1.0)
+    """
+    escala = src.scales[0]
+    if escala not in (0.0, 1.0):
+        return 1.0 / escala
+    if np.issubdtype(np.dtype(src.dtypes[0]), np.integer):
+        return 10000.0
+    maximo = src.tags(1).get("STATISTICS_MAXIMUM")
+    if maximo is not None and float(maximo) > 1.5:
+        return 10000.0
+    return 1.0
+
+def calcular_indices(ruta_imagen, ruta_salida, n_hilos=None, int16=False, gpu=False):
     """
     Calcula índices espectrales a partir de una imagen Sentinel-2.
     
@@ -90,115 +345,124 @@ def calcular_indices(ruta_imagen, ruta_salida):
         
         Los índices se calculan usando combinaciones de bandas espectrales
         y permiten clasificar diferentes tipos de cobertura del suelo.
+        La imagen se procesa por bloques (ventanas del archivo de salida),
+        por lo que la memoria usada es del orden de un bloque y no de la
+        imagen completa.
     
     Entradas:
         ruta_imagen (str o Path): Ruta al archivo GeoTIFF de entrada con bandas:
                                   1:Blue(B2), 2:Green(B3), 3:Red(B4), 
                                   4:NIR(B8), 5:SWIR1(B11), 6:SWIR2(B12)
         ruta_salida (str o Path): Ruta donde guardar el archivo de índices
+        n_hilos (int, opcional): Hilos para procesar bloques (por defecto, todas las CPUs)
+        int16 (bool, opcional): Guardar índices como int16 escalados (x10000)
+                                en vez de float32. Por defecto False
+        gpu (bool, opcional): Calcular en GPU con CuPy (requiere cupy). Por defecto False
     
     Salidas:
         dict: Diccionario con los valores promedio de cada índice:
               {'ndvi': float, 'ndbi': float, 'ndwi': float, 'bsi': float}
               
     Archivo generado:
-        GeoTIFF con 4 bandas (1:NDVI, 2:NDBI, 3:NDWI, 4:BSI)
+        GeoTIFF con 4 bandas (1:NDVI, 2:NDBI, 3:NDWI, 4:BSI). Con int16=True,
+        valores x10000, escala 0.0001 en los metadatos y nodata -32768
     """
-    # Se abre imagen de entrada para lectura
-    with rasterio.open(ruta_imagen) as src:
+    # Se abre imagen de entrada para lectura.
+    # rasterio.Env aplica las opciones de GDAL_ENV en este hilo; la opción de
+    # apertura NUM_THREADS queda asociada al dataset, por lo que también rige
+    # en las lecturas hechas desde los hilos del pool de bloques
+    with rasterio.Env(**GDAL_ENV), rasterio.open(ruta_imagen, NUM_THREADS="ALL_CPUS") as src:
         # Copiar perfil de metadatos geoespaciales (CRS, transform, etc.)
         profile = src.profile
         
         # --- Detección automática de escala de valores ---
         # Las imágenes pueden venir en escala 0-1 (reflectancia) o 0-10000 (DN)
-        # Leemos una muestra pequeña para determinar la escala
-        sample = src.read(1, window=((0, 10), (0, 10)))
-        factor = 1.0  # Factor de normalización por defecto
-        if np.max(sample) > 1.5:  # Si hay valores > 1.5, asumimos escala 0-10000
-            factor = 10000.0
-            
-        # --- Lectura de bandas espectrales ---
-        # Cada banda se normaliza a reflectancia (rango 0-1)
-        # Índices de rasterio son 1-based (1=primera banda)
-        blue  = src.read(1).astype(float) / factor  # Banda Azul (B2)
-        green = src.read(2).astype(float) / factor  # Banda Verde (B3)
-        red   = src.read(3).astype(float) / factor  # Banda Roja (B4)
-        nir   = src.read(4).astype(float) / factor  # Banda Infrarrojo Cercano (B8)
-        swir1 = src.read(5).astype(float) / factor  # Banda SWIR1 (B11)
-        
-        # --- Creación de máscara de píxeles inválidos ---
-        # Píxeles donde todas las bandas son 0 representan áreas sin datos
-        mask = (blue + green + red + nir + swir1) == 0
-        # Asignar NaN a píxeles inválidos para excluirlos de cálculos
-        blue[mask] = np.nan
-        
-    # --- Constante epsilon para estabilidad numérica ---
-    # Evita divisiones por cero en las fórmulas de índices normalizados
-    eps = 1e-10
+        factor = float(_factor_escala(src))
 
-    # I) Cálculo de índices espectrales:
-    
-    # 1. NDVI (Normalized Difference Vegetation Index) - Índice de Vegetación
-    # Fórmula: (NIR - Red) / (NIR + Red)
-    # Interpretación: Valores altos (+1) = vegetación densa, bajos (-1) = sin vegetación
-    ndvi = (nir - red) / (nir + red + eps)
-
-    # 2. NDBI (Normalized Difference Built-up Index) - Índice de Construcciones
-    # Fórmula: (SWIR - NIR) / (SWIR + NIR)
-    # Interpretación: Valores altos = áreas urbanas/construidas, bajos = vegetación
-    ndbi = (swir1 - nir) / (swir1 + nir + eps)
-
-    # 3. NDWI (Normalized Difference Water Index) - Índice de Agua (McFeeters)
-    # Fórmula: (Green - NIR) / (Green + NIR)
-    # Interpretación: Valores positivos = cuerpos de agua, negativos = tierra
-    ndwi = (green - nir) / (green + nir + eps)
-
-    # 4. BSI (Bare Soil Index) - Índice de Suelo Desnudo
-    # Fórmula: ((SWIR + Red) - (NIR + Blue)) / ((SWIR + Red) + (NIR + Blue))
-    # Interpretación: Valores altos = suelo expuesto, bajos = cobertura vegetal
-    bsi = ((swir1 + red) - (nir + blue)) / ((swir1 + red) + (nir + blue) + eps)
-
-    # II) Preparación y escritura del archivo de salida
-    
-    # Actualizar perfil de metadatos para el nuevo archivo
-    profile.update(
-        count=4,               # 4 bandas (una por índice)
-        dtype=rasterio.float32, # Tipo de dato flotante de 32 bits
-        driver='GTiff',        # Formato GeoTIFF
-        compress='lzw'         # Compresión LZW para reducir tamaño de archivo
-    )
-
-    # --- Escritura del archivo raster de salida ---
-    with rasterio.open(ruta_salida, "w", **profile) as dst:
-        # Escribir cada índice como una banda separada
-        dst.write(ndvi.astype(rasterio.float32), 1)  # Banda 1: NDVI
-        dst.write(ndbi.astype(rasterio.float32), 2)  # Banda 2: NDBI
-        dst.write(ndwi.astype(rasterio.float32), 3)  # Banda 3: NDWI
-        dst.write(bsi.astype(rasterio.float32), 4)   # Banda 4: BSI
-        
-        # Asignar nombres descriptivos a cada banda (metadatos internos)
-        dst.set_band_description(1, "NDVI")  # Vegetación
-        dst.set_band_description(2, "NDBI")  # Construcciones
-        dst.set_band_description(3, "NDWI")  # Agua
-        dst.set_band_description(4, "BSI")   # Suelo desnudo
+        # Actualizar perfil de metadatos para el nuevo archivo
+        profile.update(
+            count=4,               # 4 bandas (una por índice)
+            dtype=rasterio.float32, # Tipo de dato flotante de 32 bits
+            driver='GTiff',        # Formato GeoTIFF
+            tiled=True,            # Teselas internas: escritura por bloques y lectura parcial rápida
+            blockxsize=512,        # Tamaño de tesela (múltiplo de 16)
+            blockysize=512,
+            compress='zstd',       # ZSTD: más rápido de codificar/decodificar que LZW
+            zstd_level=3,          # Nivel por defecto (buen equilibrio tamaño/velocidad)
+            predictor=3,           # Predictor de punto flotante (índices suaves comprimen mucho mejor)
+            num_threads='all_cpus', # Compresión multihilo en GDAL
+            BIGTIFF='IF_SAFER'     # BigTIFF solo si el archivo podría superar 4 GB
+        )
+        if int16:
+            # Enteros escalados: mitad de bytes que float32 y predictor horizontal
+            # de enteros (2), que comprime mucho mejor que los float
+            profile.update(dtype=rasterio.int16, predictor=2, nodata=NODATA_INT16)
+
+        # I) Cálculo de índices espectrales por bloques (kernel fusionado):
+        #   1. NDVI = (NIR - Red) / (NIR + Red)          -> vegetación
+        #   2. NDBI = (SWIR - NIR) / (SWIR + NIR)        -> áreas construidas
+        #   3. NDWI = (Green - NIR) / (Green + NIR)      -> cuerpos de agua (McFeeters)
+        #   4. BSI  = ((SWIR + Red) - (NIR + Blue)) /
+        #             ((SWIR + Red) + (NIR + Blue))      -> suelo desnudo
+        # Los píxeles sin datos (todas las bandas en 0) quedan como NaN
+        with rasterio.open(ruta_salida, "w", **profile) as dst:
+            # Asignar nombres descriptivos a cada banda (metadatos internos)
+            dst.set_band_description(1, "NDVI")  # Vegetación
+            dst.set_band_description(2, "NDBI")  # Construcciones
+            dst.set_band_description(3, "NDWI")  # Agua
+            dst.set_band_description(4, "BSI")   # Suelo desnudo
+            if int16:
+                # Escala en los metadatos de cada banda: valor real = valor * 0.0001
+                dst.scales = (ESCALA_INT16,) * 4
+                dst.offsets = (0.0,) * 4
+                dst.update_tags(SCALE=ESCALA_INT16)
+
+            # Se recorren los bloques internos del archivo de salida, así cada
+            # escritura cae alineada con un bloque completo del GeoTIFF
+            ventanas = [window for _, window in dst.block_windows(1)]
+            lock_lectura, lock_escritura = Lock(), Lock()
+            sumas = np.zeros(4)
+            conteos = np.zeros(4, dtype=np.int64)
+            with ThreadPoolExecutor(max_workers=n_hilos or os.cpu_count()) as pool:
+                futuros = [pool.submit(_procesar_bloque, src, dst, w, factor,
+                                       lock_lectura, lock_escritura, int16, gpu) for w in ventanas]
+                for futuro in futuros:
+                    s_bloque, c_bloque = futuro.result()
+                    sumas += s_bloque
+                    conteos += c_bloque
 
     # --- Retornar estadísticas promedio para registro ---
-    # np.nanmean ignora valores NaN en el cálculo del promedio
+    # Reducción de las sumas parciales de cada bloque (equivale a np.nanmean,
+    # ignorando NaN); NaN si el índice no tiene píxeles válidos
+    promedios = np.where(conteos > 0, sumas / np.maximum(conteos, 1), np.nan)
     return {
-        "ndvi": np.nanmean(ndvi),  # Promedio de vegetación en la imagen
-        "ndbi": np.nanmean(ndbi),  # Promedio de áreas construidas
-        "ndwi": np.nanmean(ndwi),  # Promedio de presencia de agua
-        "bsi": np.nanmean(bsi)     # Promedio de suelo desnudo
+        "ndvi": promedios[0],  # Promedio de vegetación en la imagen
+        "ndbi": promedios[1],  # Promedio de áreas construidas
+        "ndwi": promedios[2],  # Promedio de presencia de agua
+        "bsi": promedios[3]    # Promedio de suelo desnudo
     }
 
 # ==============================================================================
-# 7) Bloque principal de ejecución
+# 6) Bloque principal de ejecución
 # ==============================================================================
 # Este bloque se ejecuta cuando el script se llama directamente:
 # python scripts/calculate_indices.py
 # ==============================================================================
 
 if __name__ == "__main__":
+    # --- Argumentos de línea de comandos ---
+    parser = argparse.ArgumentParser(description="Cálculo de índices espectrales")
+    parser.add_argument("--int16", action="store_true",
+                        help="Guardar índices como int16 escalados (x10000) en vez de float32")
+    parser.add_argument("--gpu", action="store_true",
+                        help="Calcular índices en GPU con CuPy (si está instalado)")
+    args = parser.parse_args()
+
+    # GPU solo si se pidió y CuPy está disponible; si no, se usa el kernel en CPU
+    usar_gpu = args.gpu and cp is not None
+    if args.gpu and not usar_gpu:
+        print("AVISO: CuPy no está instalado, se calcula en CPU.")
+
     # --- Mensaje de inicio ---
     print("➤ Iniciando cálculo de índices espectrales...")
     print(f"Origen: {RAW_DIR}")        # Mostrar directorio de imágenes originales
@@ -213,32 +477,42 @@ if __name__ == "__main__":
         print("✘ No se encontraron imágenes en data/raw")
         exit()  # Terminar ejecución si no hay datos
 
-    # --- Procesamiento con barra de progreso ---
-    # tqdm muestra el avance visual del procesamiento
-    pbar = tqdm(imagenes, desc="Procesando imágenes")
+    # --- Procesamiento en paralelo por año ---
+    # Cada imagen se procesa en un proceso distinto; se usa la mitad de las CPUs
+    # como procesos y el resto se reparte como hilos de bloques dentro de cada uno
+    iniciar_metadata()
+    n_cpu = os.cpu_count() or 1
+    n_procesos = max(1, min(len(imagenes), n_cpu // 2))
+    n_hilos = max(1, n_cpu // n_procesos)
 
-    # Iterar sobre cada imagen encontrada
-    for img in pbar:
-        try:
-            # Extraer el año del nombre del archivo (ej: sentinel2_2019.tif -> 2019)
+    resultados = {}  # año -> estadísticas
+    with ProcessPoolExecutor(max_workers=n_procesos) as ex:
+        # Extraer el año del nombre del archivo (ej: sentinel2_2019.tif -> 2019)
+        # y definir la ruta de salida (ej: indices_2019.tif)
+        futuros = {
+            ex.submit(calcular_indices, img,
+                      PROCESSED_DIR / f"indices_{img.stem.split('_')[1]}.tif", n_hilos, args.int16, usar_gpu): img
+            for img in imagenes
+        }
+
+        # tqdm muestra el avance a medida que terminan las imágenes
+        pbar = tqdm(as_completed(futuros), total=len(futuros), desc="Procesando imágenes")
+        for futuro in pbar:
+            img = futuros[futuro]
             year = img.stem.split("_")[1]
-            
-            # Definir nombre y ruta del archivo de salida
-            output_name = f"indices_{year}.tif"
-            output_path = PROCESSED_DIR / output_name
-            
-            # Actualizar barra de progreso con el año actual
             pbar.set_postfix_str(f"Año {year}")
-            
-            # Se hace el cálculo de índices espectrales
-            stats = calcular_indices(img, output_path)
-            
-            # Se registran los metadatos
-            log_metadata(output_name, year, stats)
-            
-        except Exception as e:
-            # Capturar y mostrar errores sin detener el procesamiento completo
-            print(f"\n✘ Error procesando {img.name}: {e}")
+            try:
+                resultados[year] = futuro.result()
+            except Exception as e:
+                # Capturar y mostrar errores sin detener el procesamiento completo
+                print(f"\n✘ Error procesando {img.name}: {e}")
+
+    # Se registran los metadatos desde el proceso principal y en orden de año,
+    # para que metadata.txt quede coherente aunque los procesos terminen desordenados
+    # (un único manejador con buffer de 64 KB para todas las escrituras)
+    with open(METADATA_FILE, "a", buffering=1 << 16, encoding="utf-8") as fh:
+        for year in sorted(resultados):
+            log_metadata(f"indices_{year}.tif", year, resultados[year], fh)
 
     # Mensaje de finalización 
-    print(f"\n✔ ✔ Proceso completado. Metadatos en: {METADATA_FILE}")
\ No newline at end of file
+    print(f"\n✔ ✔ Proceso completado. Metadatos en: {METADATA_FILE}")
@@ -0,0 +1,173 @@
+# =============================================================================
+# SCRIPT: convert_reports.py
+# =============================================================================
+# Descripción: Convierte los reportes CSV y las capas vectoriales que consume el
+#              dashboard (app/app.py) a formatos columnares (Arrow IPC/GeoParquet).
+#              Los reportes se guardan como Arrow IPC sin comprimir, que la app
+#              lee mapeado en memoria (sin parseo ni descompresión); las capas
+#              vectoriales como GeoParquet, que permite filtrar por extensión.
+#              Además precalcula los indicadores globales del dashboard
+#              (indicadores.json), para que la app no cargue la tabla por zona.
+#
+# Uso: python scripts/convert_reports.py
+#      (ejecutar después de los notebooks, cada vez que cambien los reportes)
+# =============================================================================
+
+# 1) Importación de librerías
+import json              # Escritura del resumen de indicadores
+import numpy as np       # Reducciones vectorizadas de los indicadores
+import pandas as pd      # Lectura de reportes CSV
+import pyarrow as pa     # Escritura de reportes en formato Arrow IPC
+import geopandas as gpd  # Lectura de capas vectoriales y escritura en GeoParquet
+from pathlib import Path # Manejo moderno de rutas de archivos multiplataforma
+
+# 2) Configuración de rutas y directorios
+
+# Obtener la ruta base del proyecto (un nivel arriba de /scripts)
+BASE_DIR = Path(__file__).parent.parent.resolve()
+
+# Directorios de datos de la app (los mismos que lee cargar_datos())
+APP_UTILS_DIR = BASE_DIR / "app" / "utils"
+REPORTS_DIR = APP_UTILS_DIR / "outputs" / "reports"
+VECTOR_DIR = APP_UTILS_DIR / "data" / "vector"
+
+# Reportes tabulares a convertir (nombre sin extensión)
+REPORTES = [
+    "04_cambios_por_zona",
+    "02_superficies_clasificadas",
+    "02_estadisticas_anuales",
+    "03_matriz_confusion",
+]
+
+# Capas vectoriales a convertir (archivo de origen)
+VECTORES = [
+    "limite_comuna.gpkg",
+    "red_vial.gpkg",
+    "manzanas_censales.gpkg",
+]
+
+# Formatos en que se guardaban antes las capas (copias ya existentes en la app)
+FORMATOS_ANTERIORES = [".shp", ".geojson"]
+
+# Resumen de indicadores globales (leído por indicadores() en la app)
+INDICADORES_FILE = REPORTS_DIR / "indicadores.json"
+
+# 3) Funciones auxiliares
+
+def convertir_reporte(nombre):
+    """
+    Convierte un reporte CSV a un archivo Arrow IPC (Feather v2) sin comprimir.
+
+    Descripción:
+        Sin compresión, las columnas numéricas del archivo quedan con el mismo
+        formato que en memoria, por lo que la app puede leerlas mapeando el
+        archivo (pa.memory_map) sin copias ni decodificación. Un archivo IPC
+        tiene un único esquema, por eso se genera un archivo por reporte.
+
+    Entradas:
+        nombre (str): Nombre del reporte sin extensión (ej: 02_estadisticas_anuales)
+
+    Salidas:
+        Path: Ruta del archivo .arrow generado
+    """
+    origen = REPORTS_DIR / f"{nombre}.csv"
+    destino = REPORTS_DIR / f"{nombre}.arrow"
+    df = pd.read_csv(origen) # Misma lectura que hacía la app
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(destino), "wb") as sink:
+        with pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+    return destino
+
+def convertir_vector(nombre):
+    """
+    Convierte una capa vectorial a GeoParquet comprimido con ZSTD.
+
+    Descripción:
+        Las columnas de tipo objeto se convierten a texto, ya que algunas capas
+        (ej: red vial de OSM) mezclan listas y escalares en una misma columna,
+        lo que Arrow no puede serializar. Se escribe la columna de cobertura
+        "bbox" para que la app pueda filtrar por extensión al leer
+        (gpd.read_parquet(..., bbox=...)).
+
+    Entradas:
+        nombre (str): Nombre del archivo vectorial de origen (ej: red_vial.gpkg);
+                      si no existe, se usa la copia anterior del mismo nombre
+                      (Shapefile o GeoJSON)
+
+    Salidas:
+        Path: Ruta del archivo .parquet generado
+    """
+    origen = VECTOR_DIR / nombre
+    if not origen.exists(): # Copias anteriores de la capa en otros formatos
+        anteriores = [origen.with_suffix(ext) for ext in FORMATOS_ANTERIORES]
+        origen = next((ruta for ruta in anteriores if ruta.exists()), origen)
+    destino = VECTOR_DIR / f"{Path(nombre).stem}.parquet"
+    gdf = gpd.read_file(origen)
+    # Columnas objeto (excepto geometría) a texto
+    cols_obj = [c for c in gdf.select_dtypes(include="object").columns if c != "geometry"]
+    gdf[cols_obj] = gdf[cols_obj].astype(str)
+    gdf.to_parquet(destino, compression="zstd", index=False, write_covering_bbox=True)
+    return destino
+
+def generar_indicadores():
+    """
+    Precalcula los indicadores globales de cambio que muestra el dashboard.
+
+    Descripción:
+        Suma las superficies de cambio de todas las zonas y promedia sus
+        porcentajes a partir de 04_cambios_por_zona. El resultado se guarda
+        en un JSON pequeño, de modo que la app no necesita leer la tabla por
+        zona salvo para ofrecerla como descarga.
+
+    Entradas:
+        None
+
+    Salidas:
+        dict: Indicadores globales {'urb_ha': float, 'perd_veg_ha': float, ...}
+    """
+    cz = pd.read_csv(REPORTS_DIR / "04_cambios_por_zona.csv")
+
+    # Dos reducciones NumPy sobre bloques 2D (columnas x zonas), una para las
+    # sumas y otra para los promedios, en vez de una llamada pandas por métrica.
+    # Se mantiene float64 para que los totales coincidan con los reportes, y las
+    # variantes nan* ignoran zonas sin datos (igual que .sum()/.mean() de pandas)
+    cols_ha = ["urbanizacion_ha", "perdida_veg_ha", "ganancia_veg_ha", "nuevo_agua_ha", "total_pixeles"]
+    cols_pct = ["urbanizacion_pct", "perdida_veg_pct", "ganancia_veg_pct"]
+    sumas = np.nansum(cz[cols_ha].to_numpy(dtype=np.float64), axis=0)
+    promedios = np.nanmean(cz[cols_pct].to_numpy(dtype=np.float64), axis=0)
+
+    indicadores = {
+        "urb_ha": float(sumas[0]),
+        "perd_veg_ha": float(sumas[1]),
+        "gan_veg_ha": float(sumas[2]),
+        "agua_ha": float(sumas[3]),
+        "total_pixeles": float(sumas[4]),
+        "promedio_urb_pct": float(promedios[0]),
+        "promedio_perd_veg_pct": float(promedios[1]),
+        "promedio_gan_veg_pct": float(promedios[2]),
+    }
+
+    with open(INDICADORES_FILE, "w", encoding="utf-8") as f:
+        json.dump(indicadores, f, indent=2)
+    return indicadores
+
+# ==============================================================================
+# 4) Bloque principal de ejecución
+# ==============================================================================
+
+if __name__ == "__main__":
+    print("➤ Convirtiendo reportes y vectores a Parquet...")
+
+    for nombre in REPORTES:
+        destino = convertir_reporte(nombre)
+        print(f"✔ {destino.name}")
+
+    for nombre in VECTORES:
+        destino = convertir_vector(nombre)
+        print(f"✔ {destino.name}")
+
+    generar_indicadores()
+    print(f"✔ {INDICADORES_FILE.name}")
+
+    print(f"\n✔ ✔ Proceso completado. Archivos en: {REPORTS_DIR} y {VECTOR_DIR}")
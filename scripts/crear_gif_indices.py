@@ -7,6 +7,7 @@ import os
 indice = "NDVI"  # NDVI, NDBI, NDWI, BSI
 input_dir = "outputs/figures"
 output_gif = f"outputs/figures/animacion_{indice}.gif"
+output_webp = f"outputs/figures/animacion_{indice}.webp"  # misma animación, más liviana
 
 anios = [2019, 2020, 2021, 2022, 2023, 2024, 2025]
 
@@ -17,13 +18,32 @@ for anio in anios:
     img = Image.open(ruta).convert("RGB")
     imagenes.append(img)
 
+# Paleta común: se cuantiza el primer frame una vez y el resto se mapea a
+# esa misma paleta (sin dithering), en vez de que save() cuantice cada frame
+# por separado. Los colores no "parpadean" entre años y el GIF comprime mejor
+primero = imagenes[0].quantize(colors=256)
+frames = [primero] + [img.quantize(palette=primero, dither=Image.Dither.NONE) for img in imagenes[1:]]
+
 # Guardar GIF
-imagenes[0].save(
+frames[0].save(
     output_gif,
     save_all=True,
-    append_images=imagenes[1:],
+    append_images=frames[1:],
     duration=800,  # ms por frame
-    loop=0
+    loop=0,
+    optimize=True
 )
 
 print(f"GIF generado: {output_gif}")
+
+# Guardar WebP animado (desde los frames RGB originales, sin paleta)
+imagenes[0].save(
+    output_webp,
+    save_all=True,
+    append_images=imagenes[1:],
+    duration=800,  # ms por frame
+    loop=0,
+    quality=80
+)
+
+print(f"WebP generado: {output_webp}")
@@ -0,0 +1,21 @@
+from PIL import Image
+import os
+
+# -------------------------------
+# CONFIGURACIÓN
+# -------------------------------
+input_dir = "app/utils/outputs/figures"
+ancho_max = 1600  # px, suficiente para la columna del dashboard
+
+anios = [2019, 2020, 2021, 2022, 2023, 2024, 2025]
+
+for anio in anios:
+    ruta = os.path.join(input_dir, f"02_mapa_indices_{anio}.png")
+    ruta_thumb = os.path.join(input_dir, f"02_mapa_indices_{anio}_thumb.png")
+
+    img = Image.open(ruta).convert("RGB")
+    # thumbnail() mantiene la relación de aspecto
+    img.thumbnail((ancho_max, ancho_max))
+    img.save(ruta_thumb, optimize=True)
+
+    print(f"Miniatura generada: {ruta_thumb} {img.size}")
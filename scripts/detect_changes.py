@@ -25,6 +25,7 @@
 #   --t1: Año inicial (base) del análisis
 #   --t2: Año final (objetivo) del análisis
 #   --method: Método a ejecutar (diff, urban, anomaly, all)
+#   --gpu: Ejecuta los cálculos por píxel en GPU con CuPy (opcional, si está instalado)
 # ==============================================================================
 
 # 1) Importación de librerías
@@ -32,10 +33,27 @@ import argparse # para el procesamiento de argumentos de línea de comandos
 import rasterio # para la lectura y escritura de datos raster geoespaciales (GeoTIFF)
 import numpy as np # para las operaciones numéricas y manipulación de arrays multidimensionales
 import geopandas as gpd # para la manipulación de datos vectoriales (shapefiles, geopackages)
-from rasterio.mask import mask # para recortar rasters usando geometrías vectoriales
+from rasterio.features import geometry_mask # para rasterizar el límite comunal como máscara booleana
+from rasterio.mask import geometry_window # para obtener la ventana que cubre el límite comunal
+from rasterio import windows # para intersectar los bloques internos con esa ventana
 from pathlib import Path # para manejar rutas de archivos multiplataforma
 from datetime import datetime # para el manejo de fechas para logging de operaciones
+import re # para extraer el año de los nombres de archivo (indices_YYYY.tif)
 import sys # para acceder a funcionalidades del intérprete (sys.exit para códigos de error)
+import atexit # para cerrar (y vaciar) el archivo de log al terminar el proceso
+from contextlib import ExitStack, contextmanager # para mantener abiertos varios rasters a la vez y escribir salidas temporales
+from rasterio.shutil import copy as rio_copy # para copiar el GeoTIFF temporal a COG
+import os # para conocer el número de núcleos disponibles
+from concurrent.futures import ThreadPoolExecutor # para leer varios rasters en paralelo
+from functools import lru_cache # para reutilizar el límite comunal y su máscara entre llamadas
+from affine import Affine # para reconstruir la transformación del raster desde la clave de caché
+from numba import njit, prange # para compilar los kernels por píxel (bucles paralelos)
+
+# CuPy es opcional: solo se usa con --gpu si hay una GPU CUDA disponible
+try:
+    import cupy as cp # para ejecutar los cálculos por píxel en GPU (misma API que NumPy)
+except ImportError:
+    cp = None
 
 # ==============================================================================
 # 2) Configuración de rutas y directorios
@@ -54,15 +72,20 @@ OUTPUT_DIR = PROCESSED_DIR
 METADATA_FILE = PROCESSED_DIR / "metadata_changes.txt"
 # Archivo vectorial con el límite comunal de Viña del Mar
 VECTOR_FILE = VECTOR_DIR / "limite_comuna.gpkg"
+# Opciones de GDAL para la lectura de rasters: decodificación multihilo
+# y 512 MB de caché de bloques
+GDAL_ENV = {"GDAL_NUM_THREADS": "ALL_CPUS", "GDAL_CACHEMAX": 512}
 
 # ==============================================================================
 # 3) Inicialización del archivo de metadatos
 
 # Modo 'w' sobrescribe el archivo, reiniciando el log en cada ejecución
-# Esto evita acumulación de logs de ejecuciones anteriores
-with open(METADATA_FILE, "w", encoding="utf-8") as f:
-    f.write("METADATOS DE DETECCIÓN DE CAMBIOS\n")
-    f.write("="*50 + "\n\n")
+# Esto evita acumulación de logs de ejecuciones anteriores.
+# El archivo queda abierto (con buffer de 64 KB) para todos los mensajes del
+# proceso, en vez de abrirlo y cerrarlo en cada línea; se cierra al salir
+_LOG_FH = open(METADATA_FILE, "w", buffering=1 << 16, encoding="utf-8")
+atexit.register(_LOG_FH.close)
+_LOG_FH.write("METADATOS DE DETECCIÓN DE CAMBIOS\n" + "="*50 + "\n\n")
 
 # ==============================================================================
 # 4) Función de logging
@@ -84,12 +107,171 @@ def log_message(msg):
     # Imprime el mensaje en la consola
     print(msg)
     # Agrega el mensaje al archivo de metadatos con timestamp
-    # Modo 'a' (append) agrega al final sin sobrescribir
-    with open(METADATA_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}\n")
+    # (manejador abierto una sola vez; el buffer se vacía al cerrar el proceso)
+    _LOG_FH.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}\n")
 
 # ==============================================================================
 # 5) Funciones utiles para el procesamiento de raster
+# ==============================================================================
+# FUNCIÓN: _cargar_limite()
+# ==============================================================================
+@lru_cache(maxsize=1)
+def _cargar_limite():
+    """
+    Lee el límite comunal desde el geopackage una sola vez por proceso.
+
+    Entradas:
+        None
+
+    Salidas:
+        gpd.GeoDataFrame: Polígono del límite comunal en su CRS original
+
+    Raises:
+        FileNotFoundError: Si no existe el archivo vectorial de límite comunal
+    """
+    # Verifica que exista el archivo vectorial del límite
+    if not VECTOR_FILE.exists():
+        raise FileNotFoundError(f"Falta el vector: {VECTOR_FILE}")
+    return gpd.read_file(VECTOR_FILE)
+
+# ==============================================================================
+# FUNCIÓN: _limite_en_crs()
+# ==============================================================================
+@lru_cache(maxsize=4)
+def _limite_en_crs(crs_wkt):
+    """
+    Devuelve las geometrías del límite comunal en el CRS de un raster.
+
+    Entradas:
+        crs_wkt (str): CRS del raster en formato WKT
+
+    Salidas:
+        gpd.GeoSeries: Geometrías del límite (reproyectadas solo si el CRS difiere)
+    """
+    gdf = _cargar_limite()
+    # Reproyecta el vector al CRS del raster si son diferentes
+    if gdf.crs != crs_wkt:
+        gdf = gdf.to_crs(crs_wkt)
+    return gdf.geometry
+
+# ==============================================================================
+# FUNCIÓN: _mascara_limite()
+# ==============================================================================
+@lru_cache(maxsize=8)
+def _mascara_limite(crs_wkt, transform, shape):
+    """
+    Rasteriza el límite comunal sobre la grilla de un raster.
+
+    Descripción:
+        Genera la máscara booleana del límite sobre la grilla indicada.
+        El resultado queda en caché por grilla (CRS, transformación, tamaño),
+        que es la misma para todos los años, y se devuelve de solo lectura
+        para que ninguna llamada lo modifique.
+
+    Entradas:
+        crs_wkt (str): CRS del raster en formato WKT
+        transform (tuple): Coeficientes de la transformación afín de la grilla
+        shape (tuple): Tamaño de la grilla (alto, ancho)
+
+    Salidas:
+        np.array: Máscara 2D booleana (True = fuera del límite)
+    """
+    fuera = geometry_mask(_limite_en_crs(crs_wkt), out_shape=shape,
+                          transform=Affine(*transform[:6]), invert=False)
+    fuera.flags.writeable = False
+    return fuera
+
+# ==============================================================================
+# FUNCIÓN: _grilla_limite()
+# ==============================================================================
+def _grilla_limite(src):
+    """
+    Obtiene la grilla de recorte del límite comunal para un raster abierto.
+
+    Descripción:
+        Calcula la ventana del raster que cubre la extensión del límite (la
+        misma que usa rasterio.mask.mask con crop=True), su transformación y
+        la máscara booleana del límite sobre esa ventana (en caché).
+
+    Entradas:
+        src (rasterio.DatasetReader): Raster abierto
+
+    Salidas:
+        tuple: (recorte, transform, fuera)
+            - recorte (Window): Ventana del raster que cubre el límite
+            - transform (Affine): Transformación de la ventana
+            - fuera (np.array): Máscara 2D booleana (True = fuera del límite)
+    """
+    crs_wkt = src.crs.to_wkt()
+    recorte = geometry_window(src, _limite_en_crs(crs_wkt))
+    transform = src.window_transform(recorte)
+    fuera = _mascara_limite(crs_wkt, tuple(transform), (int(recorte.height), int(recorte.width)))
+    return recorte, transform, fuera
+
+# ==============================================================================
+# FUNCIÓN: _bloques_recorte()
+# ==============================================================================
+def _bloques_recorte(src, recorte):
+    """
+    Recorre los bloques internos de un raster que tocan la ventana de recorte.
+
+    Entradas:
+        src (rasterio.DatasetReader): Raster abierto
+        recorte (Window): Ventana de recorte (ver _grilla_limite)
+
+    Salidas:
+        generator: Tuplas (win, filas, cols), con la ventana a leer del raster
+                   y su posición (slices) dentro del recorte
+    """
+    fila0, col0 = int(recorte.row_off), int(recorte.col_off)
+    for _, bloque in src.block_windows(1):
+        if not windows.intersect(bloque, recorte):
+            continue
+        win = windows.intersection(bloque, recorte)
+        filas = slice(int(win.row_off) - fila0, int(win.row_off) - fila0 + int(win.height))
+        cols = slice(int(win.col_off) - col0, int(win.col_off) - col0 + int(win.width))
+        yield win, filas, cols
+
+# ==============================================================================
+# FUNCIÓN: _leer_bloque()
+# ==============================================================================
+def _leer_bloque(src, bandas, win, fuera):
+    """
+    Lee un bloque de un raster de índices en float32 y lo enmascara.
+
+    Descripción:
+        Los píxeles fuera del límite o con el nodata del raster pasan a NaN;
+        en los rasters float, además, el valor 0 (sin datos). Los índices
+        guardados como int16 escalados (calculate_indices.py --int16) se
+        llevan a unidades reales con la escala de cada banda; en ellos el 0
+        es un valor válido (ej: NDVI 0.0) y solo se enmascara el nodata
+        declarado (-32768).
+
+    Entradas:
+        src (rasterio.DatasetReader): Raster de índices abierto
+        bandas (list): Bandas a leer (1 = NDVI, ...)
+        win (Window): Ventana a leer
+        fuera (np.array): Máscara 2D del límite para esa ventana
+
+    Salidas:
+        np.array: Bloque 3D (bandas, filas, columnas) float32 con NaN
+    """
+    arr = src.read(bandas, window=win, out_dtype=np.float32)
+    nodata = src.nodata if src.nodata is not None and not np.isnan(src.nodata) else None
+
+    # Fuera del límite o nodata -> NaN. El 0 como "sin datos" solo aplica a los
+    # rasters float: en int16 escalado es un índice cuantizado válido
+    invalido = np.broadcast_to(fuera[None, :, :], arr.shape).copy()
+    if not np.issubdtype(np.dtype(src.dtypes[bandas[0] - 1]), np.integer):
+        invalido |= arr == 0
+    if nodata is not None:
+        invalido |= arr == nodata
+    escalas = np.array([src.scales[b - 1] for b in bandas], dtype=np.float32)
+    if np.any(escalas != 1.0):
+        arr *= escalas[:, None, None]
+    arr[invalido] = np.nan
+    return arr
+
 # ==============================================================================
 # FUNCIÓN: load_masked_image()
 # ==============================================================================
@@ -100,7 +282,9 @@ def load_masked_image(tif_path, band_indices=None):
     Descripción:
         Lee un archivo GeoTIFF y lo recorta usando el polígono del límite
         comunal. Opcionalmente puede seleccionar bandas específicas.
-        Los píxeles fuera del límite se convierten a NaN para análisis.
+        Solo se lee la ventana que cubre la extensión del límite (la misma
+        que usa rasterio.mask.mask con crop=True), y dentro de ella los
+        píxeles fuera del límite se convierten a NaN para análisis.
     
     Entradas:
         tif_path (Path): Ruta al archivo GeoTIFF a cargar
@@ -110,42 +294,134 @@ def load_masked_image(tif_path, band_indices=None):
     
     Salidas:
         tuple: (out_image, profile)
-            - out_image (np.array): Array con los datos enmascarados (float con NaN)
-            - profile (dict): Metadatos del raster (CRS, transform, etc.)
+            - out_image (np.array): Array con los datos enmascarados (float32 con NaN),
+                                    en unidades reales si el raster tiene escala
+            - profile (dict): Metadatos del recorte (CRS, transform, tamaño, etc.)
     
     Raises:
         FileNotFoundError: Si no existe el archivo vectorial de límite comunal
     """
-    # Abre el archivo raster en modo lectura
-    with rasterio.open(tif_path) as src:
-        # Verifica que exista el archivo vectorial del límite
-        if not VECTOR_FILE.exists():
-            raise FileNotFoundError(f"Falta el vector: {VECTOR_FILE}")
-        
-        # Carga el límite comunal desde el geopackage
-        gdf = gpd.read_file(VECTOR_FILE)
-        # Reproyecta el vector al CRS del raster si son diferentes
-        if gdf.crs != src.crs:
-            gdf = gdf.to_crs(src.crs)
-        
-        # Aplica la máscara según si se especificaron bandas o no
-        if band_indices:
-            # Lee solo las bandas especificadas
-            out_image, out_transform = mask(src, gdf.geometry, crop=False, indexes=band_indices)
-            profile = src.profile
-            # Actualiza el número de bandas en el perfil
-            profile.update(count=len(band_indices))
-        else:
-            # Lee todas las bandas
-            out_image, out_transform = mask(src, gdf.geometry, crop=False)
-            profile = src.profile
-        
-        # Convierte a float para poder usar NaN como valor de máscara
-        out_image = out_image.astype(float)
-        # Los píxeles fuera del límite (valor 0) se convierten a NaN
-        out_image[out_image == 0] = np.nan
+    # Abre el archivo raster en modo lectura (decodificación multihilo de GDAL)
+    with rasterio.Env(**GDAL_ENV), rasterio.open(tif_path, NUM_THREADS="ALL_CPUS") as src:
+        # Ventana que cubre el límite comunal y máscara del límite sobre ella
+        # (calculada una sola vez por grilla y reutilizada por todos los años)
+        recorte, transform, fuera = _grilla_limite(src)
+        alto, ancho = fuera.shape
+
+        # Bandas a leer
+        bandas = list(band_indices) if band_indices else list(range(1, src.count + 1))
+        profile = src.profile
+        # Actualiza el número de bandas y la grilla (la del recorte) en el perfil
+        profile.update(count=len(bandas), height=alto, width=ancho, transform=transform)
+
+        # Lectura por bloques internos del GeoTIFF que tocan el recorte: cada
+        # bloque se lee en float32, se enmascara y se copia al resultado en una
+        # sola pasada (en vez de leer todo, convertir a float y recorrer de nuevo)
+        out_image = np.full((len(bandas), alto, ancho), np.nan, dtype=np.float32)
+        for win, filas, cols in _bloques_recorte(src, recorte):
+            out_image[:, filas, cols] = _leer_bloque(src, bandas, win, fuera[filas, cols])
         return out_image, profile
 
+# ==============================================================================
+# FUNCIÓN: load_indices()
+# ==============================================================================
+def load_indices(year):
+    """
+    Carga una sola vez el raster de índices de un año para todos los métodos.
+
+    Descripción:
+        Lee y enmascara todas las bandas de indices_YYYY.tif. Los métodos
+        reciben este array en memoria en vez de la ruta, de modo que con
+        --method all cada archivo se abre y se enmascara una sola vez.
+
+    Entradas:
+        year (int): Año del raster de índices (indices_YYYY.tif)
+
+    Salidas:
+        tuple: (img, profile) igual que load_masked_image, con las 4 bandas
+               (1=NDVI, 2=NDBI, 3=NDWI, 4=BSI)
+    """
+    return load_masked_image(PROCESSED_DIR / f"indices_{year}.tif")
+
+# ==============================================================================
+# FUNCIÓN: _perfil_gtiff()
+# ==============================================================================
+def _perfil_gtiff(profile, dtype, nodata, count):
+    """
+    Construye el perfil de escritura del GeoTIFF teselado intermedio.
+
+    Descripción:
+        Toma la grilla (tamaño, CRS, transformación) del perfil de entrada y
+        define un GeoTIFF con teselas de 512x512 y compresión DEFLATE con
+        predictor (horizontal para enteros, de punto flotante para float32).
+        A diferencia del driver COG (solo copia: GDAL arma el raster completo
+        en memoria y lo copia al cerrar), el GTiff escribe cada ventana
+        directo a disco, por lo que sirve para las salidas escritas por
+        bloques. El COG final se genera después por copia (ver _escribir_cog).
+
+    Entradas:
+        profile (dict): Perfil de la grilla de salida
+        dtype (str): Tipo de dato de salida (ej: rasterio.int8)
+        nodata (float): Valor nodata de salida
+        count (int): Número de bandas
+
+    Salidas:
+        dict: Perfil para rasterio.open(..., "w", **perfil)
+    """
+    return {
+        "driver": "GTiff",
+        "dtype": dtype,
+        "nodata": nodata,
+        "count": count,
+        "height": profile["height"],
+        "width": profile["width"],
+        "crs": profile["crs"],
+        "transform": profile["transform"],
+        "tiled": True,
+        "blockxsize": 512,
+        "blockysize": 512,
+        "compress": "DEFLATE",
+        "predictor": 2 if "int" in str(dtype) else 3,
+        "bigtiff": "IF_SAFER",
+    }
+
+# ==============================================================================
+# FUNCIÓN: _escribir_cog()
+# ==============================================================================
+@contextmanager
+def _escribir_cog(output_path, profile, dtype, nodata, count):
+    """
+    Abre una salida para escribirla por ventanas y la deja como COG al cerrar.
+
+    Descripción:
+        Las ventanas se escriben en un GeoTIFF teselado temporal (ver
+        _perfil_gtiff), que va directo a disco sin mantener el raster
+        completo en memoria. Al salir del bloque with, el temporal se copia
+        como Cloud-Optimized GeoTIFF (teselas de 512x512, DEFLATE y overviews
+        internas, las clases remuestreadas por vecino más cercano para no
+        mezclar códigos): la copia lee el temporal por bloques. Luego el
+        temporal se borra (también si hubo un error).
+
+    Entradas:
+        output_path (Path): Ruta del COG de salida
+        profile (dict): Perfil de la grilla de salida
+        dtype (str): Tipo de dato de salida (ej: rasterio.int8)
+        nodata (float): Valor nodata de salida
+        count (int): Número de bandas
+
+    Salidas:
+        rasterio.io.DatasetWriter: Raster temporal abierto en escritura
+    """
+    temporal = output_path.with_name(f"{output_path.stem}.tmp.tif")
+    try:
+        with rasterio.open(temporal, "w", **_perfil_gtiff(profile, dtype, nodata, count)) as dst:
+            yield dst
+        rio_copy(temporal, output_path, driver="COG", COMPRESS="DEFLATE", PREDICTOR="YES",
+                 BLOCKSIZE=512, OVERVIEWS="AUTO", BIGTIFF="IF_SAFER", NUM_THREADS="ALL_CPUS",
+                 OVERVIEW_RESAMPLING="NEAREST" if "int" in str(dtype) else "AVERAGE")
+    finally:
+        temporal.unlink(missing_ok=True)
+
 # ==============================================================================
 # FUNCIÓN: save_raster()
 # ==============================================================================
@@ -154,8 +430,10 @@ def save_raster(data, profile, output_path, description=None):
     Guarda un array numpy como raster GeoTIFF comprimido.
     
     Descripción:
-        Escribe datos raster a disco con compresión LZW para optimizar
-        el espacio. Detecta automáticamente el tipo de dato apropiado
+        Escribe datos raster a disco como Cloud-Optimized GeoTIFF (teselado,
+        DEFLATE y overviews internas), de modo que las lecturas parciales o
+        a baja resolución (visualización, GIF) no decodifiquen el raster
+        completo. Detecta automáticamente el tipo de dato apropiado
         (int8, int16 o float32) según el rango de valores.
     
     Entradas:
@@ -177,18 +455,19 @@ def save_raster(data, profile, output_path, description=None):
         dtype = rasterio.float32
         nodata = np.nan  # Valor nodata para flotantes
 
-    # Actualiza el perfil con el tipo de dato, nodata y compresión LZW
-    profile.update(dtype=dtype, nodata=nodata, compress='lzw')
-    
-    # Escribe el archivo raster
-    with rasterio.open(output_path, "w", **profile) as dst:
+    # Convierte al tipo de salida una sola vez (sin copia si ya lo es, como
+    # las clases int8) y escribe vistas del mismo array
+    data = np.asarray(data, dtype=dtype)
+
+    # Escribe el archivo raster como Cloud-Optimized GeoTIFF (ver _escribir_cog)
+    with _escribir_cog(output_path, profile, dtype, nodata, 1 if data.ndim == 2 else data.shape[0]) as dst:
         if data.ndim == 2:
             # Datos 2D (una sola banda)
-            dst.write(data.astype(dtype), 1)
+            dst.write(data, 1)
         else:
             # Datos 3D (múltiples bandas)
             for i in range(data.shape[0]):
-                dst.write(data[i].astype(dtype), i + 1)
+                dst.write(data[i], i + 1)
         
         # Agrega descripción a los metadatos si se proporcionó
         if description:
@@ -199,10 +478,77 @@ def save_raster(data, profile, output_path, description=None):
 
 # ==============================================================================
 # 6) Métodos de detección de cambios
+# ==============================================================================
+# KERNEL: _diferencia_umbral() - DIFERENCIA Y UMBRAL EN UNA PASADA
+# ==============================================================================
+@njit(parallel=True, cache=True)
+def _diferencia_umbral(banda_t1, banda_t2, umbral, change_map):
+    """
+    Clasifica la diferencia T2 - T1 de cada píxel según el umbral.
+
+    Descripción:
+        Calcula la diferencia (en float64), asigna ganancia (1), pérdida (-1)
+        o sin cambio (0) y cuenta cada caso en un único bucle paralelo, sin
+        arrays temporales para la diferencia ni para las máscaras. Los
+        píxeles sin datos (NaN) quedan en 0 y se cuentan aparte.
+
+    Entradas:
+        banda_t1 (np.array 2D): Índice del año base
+        banda_t2 (np.array 2D): Índice del año objetivo
+        umbral (float): Umbral de cambio significativo
+        change_map (np.array 2D int8): Salida preasignada (-1, 0, 1)
+
+    Salidas:
+        np.array: Conteos por fila, forma (alto, 4): pérdida, sin cambio,
+                  ganancia y sin datos
+    """
+    alto, ancho = change_map.shape
+    conteos = np.zeros((alto, 4), dtype=np.int64)
+    for i in prange(alto):
+        for j in range(ancho):
+            d = np.float64(banda_t2[i, j]) - np.float64(banda_t1[i, j])
+            if not np.isfinite(d):
+                change_map[i, j] = 0
+                conteos[i, 3] += 1
+            elif d > umbral:
+                change_map[i, j] = 1   # Ganancia
+                conteos[i, 2] += 1
+            elif d < -umbral:
+                change_map[i, j] = -1  # Pérdida
+                conteos[i, 0] += 1
+            else:
+                change_map[i, j] = 0   # Sin cambio
+                conteos[i, 1] += 1
+    return conteos
+
+def _diferencia_umbral_xp(xp, banda_t1, banda_t2, umbral):
+    """
+    Versión con operaciones de array (NumPy o CuPy) de _diferencia_umbral.
+
+    Descripción:
+        Aplica las mismas reglas que el kernel (diferencia en float64, umbral
+        y píxeles sin datos en 0), usada para la ejecución en GPU.
+
+    Entradas:
+        xp (module): numpy o cupy
+        banda_t1, banda_t2 (xp.ndarray 2D): Índice del año base y objetivo
+        umbral (float): Umbral de cambio significativo
+
+    Salidas:
+        tuple: (change_map, conteos)
+            - change_map (xp.ndarray 2D int8): -1, 0, 1
+            - conteos (xp.ndarray): pérdida, sin cambio, ganancia y sin datos, forma (4,)
+    """
+    d = banda_t2.astype(xp.float64) - banda_t1.astype(xp.float64)
+    change_map = (d > umbral).astype(xp.int8) - (d < -umbral).astype(xp.int8)
+    codigos = (change_map + 1).astype(xp.int64)
+    codigos[~xp.isfinite(d)] = 3
+    return change_map, xp.bincount(codigos.ravel(), minlength=4)
+
 # ==============================================================================
 # MÉTODO 1: method_difference() - DIFERENCIA SIMPLE DE ÍNDICES
 # ==============================================================================
-def method_difference(t1_path, t2_path, index_band=1, threshold=0.15):
+def method_difference(img_t1, img_t2, profile, t1, t2, index_band=1, threshold=0.15, gpu=False):
     """
     Detecta cambios mediante resta simple de índices espectrales (T2 - T1).
     
@@ -217,12 +563,16 @@ def method_difference(t1_path, t2_path, index_band=1, threshold=0.15):
         Por defecto usa NDVI (banda 1) para detectar cambios en vegetación.
     
     Entradas:
-        t1_path (Path): Ruta al raster de índices del año inicial (base)
-        t2_path (Path): Ruta al raster de índices del año final (objetivo)
+        img_t1 (np.array): Índices enmascarados del año inicial (base), ver load_indices
+        img_t2 (np.array): Índices enmascarados del año final (objetivo)
+        profile (dict): Perfil raster de los índices cargados
+        t1 (int): Año inicial (para el nombre del archivo de salida)
+        t2 (int): Año final (para el nombre del archivo de salida)
         index_band (int): Número de banda a analizar. Default=1 (NDVI)
                          Bandas disponibles: 1=NDVI, 2=NDBI, 3=NDWI, 4=BSI
         threshold (float): Umbral de cambio significativo. Default=0.15
                           Valores típicos: 0.10-0.20 para NDVI
+        gpu (bool): Si es True, calcula en GPU con CuPy. Default=False
     
     Salidas:
         Ninguna (genera archivo GeoTIFF: cambio_diferencia_indices_YYYY_YYYY.tif)
@@ -232,42 +582,160 @@ def method_difference(t1_path, t2_path, index_band=1, threshold=0.15):
     """
     log_message(f"--- Ejecutando Método 1: Diferencia Simple (Banda {index_band}) ---")
     
-    # Carga las imágenes de ambas fechas (solo la banda especificada)
-    img_t1, prof = load_masked_image(t1_path, [index_band])
-    img_t2, _    = load_masked_image(t2_path, [index_band])
-    
-    # Silencia warnings por operaciones con NaN (píxeles enmascarados)
-    with np.errstate(invalid='ignore'):
-        # Calcula la diferencia: valores positivos = aumento, negativos = disminución
-        diff = img_t2[0] - img_t1[0]
-        
-        # Inicializa mapa de cambios como "sin cambio" (0)
-        change_map = np.zeros_like(diff, dtype=np.int8)
-        # Marca píxeles con ganancia significativa
-        change_map[diff > threshold] = 1   # Ganancia
-        # Marca píxeles con pérdida significativa
-        change_map[diff < -threshold] = -1 # Pérdida
-    
-    # Calcula estadísticas solo para píxeles válidos (no NaN)
-    valid_mask = np.isfinite(diff)
-    total = np.count_nonzero(valid_mask)
+    # Diferencia, umbral y conteos en una sola pasada (ver _diferencia_umbral),
+    # sobre vistas de la banda especificada en los índices ya cargados
+    if gpu:
+        # Copia la banda a la GPU, calcula y trae el resultado de vuelta
+        change_map, conteos = _diferencia_umbral_xp(
+            cp, cp.asarray(img_t1[index_band - 1]), cp.asarray(img_t2[index_band - 1]), threshold)
+        change_map, conteos = cp.asnumpy(change_map), cp.asnumpy(conteos)
+    else:
+        change_map = np.empty(img_t1.shape[1:], dtype=np.int8)
+        conteos = _diferencia_umbral(img_t1[index_band - 1], img_t2[index_band - 1],
+                                     threshold, change_map).sum(axis=0)
+    # Conteos por código: 0 = pérdida, 1 = sin cambio, 2 = ganancia, 3 = sin datos
+    neg, sin_cambio, pos, _ = conteos
+    total = neg + sin_cambio + pos
     
     # Reporta estadísticas si hay píxeles válidos
     if total > 0:
-        pos = np.count_nonzero(change_map == 1)
-        neg = np.count_nonzero(change_map == -1)
         log_message(f"Ganancia (> {threshold}): {pos} px ({pos/total:.1%})")
         log_message(f"Pérdida (< -{threshold}): {neg} px ({neg/total:.1%})")
     
     # Genera nombre de archivo de salida basado en los años
-    out_name = f"cambio_diferencia_indices_{t1_path.stem.split('_')[1]}_{t2_path.stem.split('_')[1]}.tif"
+    out_name = f"cambio_diferencia_indices_{t1}_{t2}.tif"
     # Guarda el resultado
-    save_raster(change_map, prof, OUTPUT_DIR / out_name, description=f"Diff Band {index_band}")
+    save_raster(change_map, profile, OUTPUT_DIR / out_name, description=f"Diff Band {index_band}")
+
+# ==============================================================================
+# TABLA: _construir_lut_clases() - CLASE SEGÚN LA COMBINACIÓN DE CONDICIONES
+# ==============================================================================
+# Cada condición de las reglas de cambio ocupa un bit del código del píxel:
+#   bit 0: píxel válido (NDVI con datos en ambas fechas)
+#   bit 1: NDVI_t1 > 0.3           bit 2: NDBI_t2 > 0
+#   bit 3: NDBI_t2 - NDBI_t1 > 0.1 bit 4: NDVI_t1 - NDVI_t2 > 0.1
+#   bit 5: NDBI_t2 <= 0            bit 6: NDVI_t2 > 0.3
+#   bit 7: NDVI_t2 - NDVI_t1 > 0.1 bit 8: NDWI_t1 < 0
+#   bit 9: NDWI_t2 > 0
+# (NDBI_t2 > 0 y NDBI_t2 <= 0 van en bits separados porque con NaN ambas son falsas)
+N_BITS_CLASES = 10
+
+def _construir_lut_clases():
+    """
+    Precalcula la clase de cambio para cada combinación de condiciones.
+
+    Descripción:
+        Aplica una sola vez, sobre los 2^10 códigos posibles, la cascada de
+        reglas de method_urban_classification con su orden de prioridad.
+        El kernel solo arma el código del píxel y consulta esta tabla.
+
+    Entradas:
+        None
+
+    Salidas:
+        np.array: Tabla int8 de 1024 entradas con la clase (0-4) de cada código
+    """
+    codigos = np.arange(1 << N_BITS_CLASES)
+    b = [(codigos >> k) & 1 == 1 for k in range(N_BITS_CLASES)]
+    valido = b[0]
+    reglas = [
+        valido & b[1] & b[2] & b[3],  # 1: Urbanización
+        valido & b[1] & b[4] & b[5],  # 2: Pérdida de vegetación (no urbana)
+        valido & b[6] & b[7],         # 3: Ganancia de vegetación
+        valido & b[8] & b[9],         # 4: Nuevo cuerpo de agua
+    ]
+    # np.select respeta el orden: la primera regla que se cumple define la clase
+    return np.select(reglas, [1, 2, 3, 4], default=0).astype(np.int8)
+
+LUT_CLASES = _construir_lut_clases()
+
+# ==============================================================================
+# KERNEL: _clasificar_cambios() - REGLAS DE CAMBIO URBANO EN UNA PASADA
+# ==============================================================================
+@njit(parallel=True, cache=True)
+def _clasificar_cambios(ndvi_t1, ndbi_t1, ndwi_t1, ndvi_t2, ndbi_t2, ndwi_t2, lut, clase):
+    """
+    Asigna la clase de cambio de cada píxel sin bifurcaciones.
+
+    Descripción:
+        Por cada píxel evalúa todas las condiciones de las reglas, las empaqueta
+        en un código de bits (sumas de comparaciones, sin if) y obtiene la clase
+        de la tabla precalculada (ver _construir_lut_clases), en un único bucle
+        paralelo que además cuenta los píxeles por clase. Las diferencias entre
+        fechas se calculan en float64, igual que antes con los arrays completos.
+        Las comparaciones con NaN son falsas, por lo que los píxeles sin datos
+        quedan en clase 0.
+
+    Entradas:
+        ndvi_t1, ndbi_t1, ndwi_t1 (np.array 2D): Índices del año base
+        ndvi_t2, ndbi_t2, ndwi_t2 (np.array 2D): Índices del año objetivo
+        lut (np.array int8): Tabla código -> clase (LUT_CLASES)
+        clase (np.array 2D int8): Salida preasignada con la clase (0-4)
+
+    Salidas:
+        np.array: Conteos por fila y clase, forma (alto, 5) (cada fila la
+                  procesa un solo hilo; se suman fuera del kernel)
+    """
+    alto, ancho = clase.shape
+    conteos = np.zeros((alto, 5), dtype=np.int64)
+    for i in prange(alto):
+        for j in range(ancho):
+            v1 = np.float64(ndvi_t1[i, j])
+            v2 = np.float64(ndvi_t2[i, j])
+            b1 = np.float64(ndbi_t1[i, j])
+            b2 = np.float64(ndbi_t2[i, j])
+            codigo = (
+                (np.isfinite(v1) and np.isfinite(v2))
+                | ((v1 > 0.3) << 1)
+                | ((b2 > 0.0) << 2)
+                | (((b2 - b1) > 0.1) << 3)
+                | (((v1 - v2) > 0.1) << 4)
+                | ((b2 <= 0.0) << 5)
+                | ((v2 > 0.3) << 6)
+                | (((v2 - v1) > 0.1) << 7)
+                | ((ndwi_t1[i, j] < 0.0) << 8)
+                | ((ndwi_t2[i, j] > 0.0) << 9)
+            )
+            c = lut[codigo]
+            clase[i, j] = c
+            conteos[i, c] += 1
+    return conteos
+
+def _clasificar_cambios_xp(xp, ndvi_t1, ndbi_t1, ndwi_t1, ndvi_t2, ndbi_t2, ndwi_t2, lut):
+    """
+    Versión con operaciones de array (NumPy o CuPy) de _clasificar_cambios.
+
+    Descripción:
+        Arma el mismo código de bits por píxel (diferencias en float64) y
+        obtiene la clase de la misma tabla, usada para la ejecución en GPU.
+
+    Entradas:
+        xp (module): numpy o cupy
+        ndvi_t1, ndbi_t1, ndwi_t1 (xp.ndarray 2D): Índices del año base
+        ndvi_t2, ndbi_t2, ndwi_t2 (xp.ndarray 2D): Índices del año objetivo
+        lut (xp.ndarray int8): Tabla código -> clase (LUT_CLASES)
+
+    Salidas:
+        tuple: (clase, conteos)
+            - clase (xp.ndarray 2D int8): Clase de cambio (0-4)
+            - conteos (xp.ndarray): Píxeles por clase, forma (5,)
+    """
+    v1, v2 = ndvi_t1.astype(xp.float64), ndvi_t2.astype(xp.float64)
+    b1, b2 = ndbi_t1.astype(xp.float64), ndbi_t2.astype(xp.float64)
+    condiciones = [
+        xp.isfinite(v1) & xp.isfinite(v2), v1 > 0.3, b2 > 0.0, (b2 - b1) > 0.1,
+        (v1 - v2) > 0.1, b2 <= 0.0, v2 > 0.3, (v2 - v1) > 0.1, ndwi_t1 < 0.0, ndwi_t2 > 0.0,
+    ]
+    codigo = xp.zeros(v1.shape, dtype=xp.int32)
+    for k, c in enumerate(condiciones):
+        codigo |= c.astype(xp.int32) << k
+    clase = lut[codigo]
+    return clase, xp.bincount(clase.ravel(), minlength=5)
 
 # ==============================================================================
 # MÉTODO 2: method_urban_classification() - CLASIFICACIÓN DE CAMBIO URBANO
 # ==============================================================================
-def method_urban_classification(t1_path, t2_path):
+def method_urban_classification(img_t1, img_t2, profile, t1, t2, gpu=False):
     """
     Clasifica tipos de cambio urbano combinando múltiples índices espectrales.
     
@@ -286,8 +754,12 @@ def method_urban_classification(t1_path, t2_path):
         típicos para zonas mediterráneas de Chile central.
     
     Entradas:
-        t1_path (Path): Ruta al raster de índices del año inicial
-        t2_path (Path): Ruta al raster de índices del año final
+        img_t1 (np.array): Índices enmascarados del año inicial, ver load_indices
+        img_t2 (np.array): Índices enmascarados del año final
+        profile (dict): Perfil raster de los índices cargados
+        t1 (int): Año inicial (para el nombre del archivo de salida)
+        t2 (int): Año final (para el nombre del archivo de salida)
+        gpu (bool): Si es True, calcula en GPU con CuPy. Default=False
     
     Salidas:
         Ninguna (genera archivo GeoTIFF: cambio_urbano_YYYY_YYYY.tif)
@@ -297,56 +769,26 @@ def method_urban_classification(t1_path, t2_path):
     """
     log_message(f"--- Ejecutando Método 2: Clasificación Urbana ---")
     
-    # Carga las 3 primeras bandas de cada fecha: NDVI, NDBI, NDWI
-    img_t1, prof = load_masked_image(t1_path, [1, 2, 3])
-    img_t2, _    = load_masked_image(t2_path, [1, 2, 3])
-    
-    # Desempaqueta las bandas para cada fecha
-    ndvi_t1, ndbi_t1, ndwi_t1 = img_t1  # Índices del año base
-    ndvi_t2, ndbi_t2, ndwi_t2 = img_t2  # Índices del año objetivo
-    
-    # Inicializa el mapa de clases como "sin cambio" (0)
-    clase = np.zeros_like(ndvi_t1, dtype=np.int8)
-    # Máscara de píxeles válidos (con datos en ambas fechas)
-    valid = np.isfinite(ndvi_t1) & np.isfinite(ndvi_t2)
-    
-    # Silencia warnings en operaciones booleanas con NaN
-    with np.errstate(invalid='ignore'):
-        # ---------------------------------------------------------------
-        # CLASE 1: URBANIZACIÓN
-        # Condiciones: Era vegetación (NDVI alto) → Ahora construido (NDBI positivo)
-        # y el NDBI aumentó significativamente (>0.1)
-        # ---------------------------------------------------------------
-        mask_urb = (ndvi_t1 > 0.3) & (ndbi_t2 > 0.0) & ((ndbi_t2 - ndbi_t1) > 0.1)
-        clase[mask_urb & valid] = 1
-        
-        # ---------------------------------------------------------------
-        # CLASE 2: PÉRDIDA DE VEGETACIÓN (NO URBANA)
-        # Condiciones: Era vegetación → Perdió vegetación pero NO se urbanizó
-        # Típico de incendios, sequía o deforestación
-        # ---------------------------------------------------------------
-        mask_loss = (ndvi_t1 > 0.3) & ((ndvi_t1 - ndvi_t2) > 0.1) & (ndbi_t2 <= 0.0)
-        # Solo asigna si no fue ya clasificado como urbanización
-        clase[mask_loss & valid & (clase == 0)] = 2
-        
-        # ---------------------------------------------------------------
-        # CLASE 3: GANANCIA DE VEGETACIÓN
-        # Condiciones: Ahora tiene vegetación significativa que antes no tenía
-        # Típico de recuperación post-incendio o nuevas áreas verdes
-        # ---------------------------------------------------------------
-        mask_gain = (ndvi_t2 > 0.3) & ((ndvi_t2 - ndvi_t1) > 0.1)
-        clase[mask_gain & valid & (clase == 0)] = 3
-        
-        # ---------------------------------------------------------------
-        # CLASE 4: NUEVO CUERPO DE AGUA
-        # Condiciones: No era agua (NDWI negativo) → Ahora es agua (NDWI positivo)
-        # Detecta inundaciones, nuevos embalses, etc.
-        # ---------------------------------------------------------------
-        mask_new_water = (ndwi_t1 < 0.0) & (ndwi_t2 > 0.0)
-        clase[mask_new_water & valid & (clase == 0)] = 4
-    
-    # Calcula y reporta estadísticas por clase
-    counts = np.bincount(clase[valid & (clase > 0)].flatten())
+    # Desempaqueta las 3 primeras bandas de cada fecha: NDVI, NDBI, NDWI
+    ndvi_t1, ndbi_t1, ndwi_t1 = img_t1[:3]  # Índices del año base
+    ndvi_t2, ndbi_t2, ndwi_t2 = img_t2[:3]  # Índices del año objetivo
+
+    # Clasificación en una sola pasada por píxel (ver _clasificar_cambios):
+    # reemplaza las 4 máscaras booleanas, las asignaciones en cascada y el bincount
+    if gpu:
+        # Copia las bandas a la GPU, clasifica y trae el resultado de vuelta
+        bandas = [cp.asarray(b) for b in (ndvi_t1, ndbi_t1, ndwi_t1, ndvi_t2, ndbi_t2, ndwi_t2)]
+        clase, counts = _clasificar_cambios_xp(cp, *bandas, cp.asarray(LUT_CLASES))
+        clase, counts = cp.asnumpy(clase), cp.asnumpy(counts)
+    else:
+        clase = np.empty(ndvi_t1.shape, dtype=np.int8)
+        counts = _clasificar_cambios(ndvi_t1, ndbi_t1, ndwi_t1, ndvi_t2, ndbi_t2, ndwi_t2,
+                                     LUT_CLASES, clase).sum(axis=0)
+
+    # Calcula y reporta estadísticas por clase (la clase 0 no se reporta)
+    # (trim_zeros deja el mismo largo que tenía np.bincount sobre las clases > 0)
+    counts[0] = 0
+    counts = np.trim_zeros(counts, "b")
     labels = {1: "Urbanización", 2: "Pérdida Veg", 3: "Ganancia Veg", 4: "Nuevo Agua"}
     
     for k, v in labels.items():
@@ -355,13 +797,84 @@ def method_urban_classification(t1_path, t2_path):
             log_message(f"Clase {v}: {counts[k]} px (~{counts[k]*0.01:.1f} ha)")
 
     # Genera nombre y guarda el resultado
-    out_name = f"cambio_urbano_{t1_path.stem.split('_')[1]}_{t2_path.stem.split('_')[1]}.tif"
-    save_raster(clase, prof, OUTPUT_DIR / out_name, description="Urban Change Classification")
+    out_name = f"cambio_urbano_{t1}_{t2}.tif"
+    save_raster(clase, profile, OUTPUT_DIR / out_name, description="Urban Change Classification")
+
+# ==============================================================================
+# KERNEL: _zscore_bloque() - MEDIA, DESVIACIÓN Y Z-SCORE EN UNA PASADA
+# ==============================================================================
+@njit(parallel=True, cache=True)
+def _zscore_bloque(serie, actual, z):
+    """
+    Calcula el Z-Score de un bloque contra su serie histórica.
+
+    Descripción:
+        Por cada píxel recorre los años una sola vez acumulando la media y
+        la suma de cuadrados de las diferencias (algoritmo de Welford, en
+        float64), ignorando los años sin datos (NaN) como np.nanmean y
+        np.nanstd. La desviación es poblacional (M2 / n), igual que np.nanstd.
+        Los Z-Score no finitos (sin historia o sin dato actual) quedan en 0.
+
+    Entradas:
+        serie (np.array 3D): NDVI histórico del bloque (años, filas, columnas)
+        actual (np.array 2D): NDVI del año objetivo en el bloque
+        z (np.array 2D float32): Salida preasignada con el Z-Score
+
+    Salidas:
+        Ninguna (escribe en z)
+    """
+    anios, alto, ancho = serie.shape
+    for i in prange(alto):
+        for j in range(ancho):
+            n = 0
+            media = 0.0
+            m2 = 0.0
+            for t in range(anios):
+                x = np.float64(serie[t, i, j])
+                if np.isfinite(x):
+                    n += 1
+                    delta = x - media
+                    media += delta / n
+                    m2 += delta * (x - media)
+            v = np.float64(actual[i, j])
+            if n == 0 or not np.isfinite(v):
+                z[i, j] = 0.0
+                continue
+            # Se suma 1e-6 a std para evitar división por cero
+            zij = (v - media) / (np.sqrt(m2 / n) + 1e-6)
+            z[i, j] = zij if np.isfinite(zij) else 0.0
+
+def _zscore_bloque_xp(xp, serie, actual):
+    """
+    Versión con operaciones de array (NumPy o CuPy) de _zscore_bloque.
+
+    Descripción:
+        Media y desviación estándar poblacional ignorando NaN (en float64) y
+        Z-Score con las mismas reglas que el kernel, usada para la ejecución
+        en GPU.
+
+    Entradas:
+        xp (module): numpy o cupy
+        serie (xp.ndarray 3D): NDVI histórico del bloque (años, filas, columnas)
+        actual (xp.ndarray 2D): NDVI del año objetivo en el bloque
+
+    Salidas:
+        xp.ndarray: Z-Score 2D float32 (0 donde no es finito)
+    """
+    x = serie.astype(xp.float64)
+    validos = xp.isfinite(x)
+    n = validos.sum(axis=0)
+    n_div = xp.maximum(n, 1)
+    media = xp.where(validos, x, 0.0).sum(axis=0) / n_div
+    var = xp.where(validos, (x - media) ** 2, 0.0).sum(axis=0) / n_div
+    z = (actual.astype(xp.float64) - media) / (xp.sqrt(var) + 1e-6)
+    z[(n == 0) | ~xp.isfinite(z)] = 0.0
+    return z.astype(xp.float32)
 
 # ==============================================================================
 # MÉTODO 3: method_anomaly() - ANÁLISIS DE ANOMALÍAS TEMPORALES (Z-SCORE)
 # ==============================================================================
-def method_anomaly(target_year):
+def method_anomaly(target_year, loaded=None, gpu=False):
     """
     Detecta anomalías usando Z-Score histórico (Criterio 7.0 - Serie Temporal).
     
@@ -378,10 +891,19 @@ def method_anomaly(target_year):
         
         Este método es útil para identificar cambios que se desvían del
         comportamiento típico de la zona, filtrando variaciones estacionales.
+        
+        El cálculo se hace por bloques internos del raster: para cada bloque
+        se calculan la media, la desviación estándar y el Z-Score en una sola
+        pasada compilada (ver _zscore_bloque) y se escribe el resultado, sin
+        cargar el stack completo de años en memoria.
     
     Entradas:
         target_year (int): Año objetivo a comparar contra la historia.
                           Debe existir un archivo indices_YYYY.tif
+        loaded (dict, opcional): Índices ya cargados {año: (img, profile)}
+                                 (ej: t1 y t2 desde main); esos años no se
+                                 vuelven a leer
+        gpu (bool): Si es True, calcula el Z-Score de cada bloque en GPU con CuPy
     
     Salidas:
         Ninguna (genera archivo GeoTIFF: anomalia_temporal_YYYY.tif)
@@ -392,50 +914,80 @@ def method_anomaly(target_year):
     """
     log_message(f"--- Ejecutando Método 3: Anomalías Temporales (Target: {target_year}) ---")
     
-    # Busca todos los archivos de índices disponibles
-    all_files = sorted(list(PROCESSED_DIR.glob("indices_*.tif")))
-    # Separa archivos históricos (todos excepto el año objetivo)
-    history_files = [f for f in all_files if str(target_year) not in f.name]
+    # Busca todos los archivos de índices disponibles, indexados por año
+    # (el año se lee del nombre exacto indices_YYYY.tif, no por substring)
+    files_by_year = {int(m.group(1)): f for f in PROCESSED_DIR.glob("indices_*.tif")
+                     if (m := re.fullmatch(r"indices_(\d{4})\.tif", f.name))}
+    # Separa archivos históricos (todos excepto el año objetivo), en orden cronológico
+    history_files = [files_by_year[y] for y in sorted(files_by_year) if y != target_year]
     # Identifica el archivo del año objetivo
-    target_file = next((f for f in all_files if str(target_year) in f.name), None)
+    target_file = files_by_year.get(target_year)
     
     # Valida que existan los datos necesarios
     if not target_file or not history_files:
         log_message("✘ Error: Faltan datos para análisis histórico.")
         return
 
-    # Construye el stack temporal con los datos históricos
-    stack = []
-    for f in history_files:
-        # Carga solo la banda 1 (NDVI) de cada año histórico
-        img, prof = load_masked_image(f, [1])
-        stack.append(img[0])
-    
-    # Silencia warnings por operaciones con muchos NaN
-    with np.errstate(invalid='ignore'):
-        # Convierte la lista a array 3D: (años, filas, columnas)
-        stack = np.array(stack)
-        # Calcula la media histórica ignorando NaN
-        mean_hist = np.nanmean(stack, axis=0)
-        # Calcula la desviación estándar histórica ignorando NaN
-        std_hist = np.nanstd(stack, axis=0)
-        
-        # Carga el año objetivo
-        target_img, _ = load_masked_image(target_file, [1])
-        current = target_img[0]
-        
-        # Calcula Z-Score: (valor - media) / desviación_estándar
-        # Se suma 1e-6 a std para evitar división por cero
-        with np.errstate(divide='ignore'):  # Ignora división por cero
-            z_score = (current - mean_hist) / (std_hist + 1e-6)
-        
-        # Reemplaza valores infinitos o NaN con 0 (sin anomalía)
-        z_score[~np.isfinite(z_score)] = 0
-    
-    # Genera nombre y guarda el resultado
-    out_name = f"anomalia_temporal_{target_year}.tif"
-    prof.update(dtype=rasterio.float32, nodata=np.nan)
-    save_raster(z_score, prof, OUTPUT_DIR / out_name, description=f"NDVI Z-Score {target_year}")
+    loaded = loaded or {}
+    out_path = OUTPUT_DIR / f"anomalia_temporal_{target_year}.tif"
+
+    def anio(f):
+        # Año de un archivo indices_YYYY.tif
+        return int(f.stem.split('_')[1])
+
+    # Abre una sola vez todos los rasters que no están ya cargados en memoria;
+    # el año objetivo siempre se abre, porque define la grilla y los bloques
+    with ExitStack() as pila:
+        pila.enter_context(rasterio.Env(**GDAL_ENV))
+        srcs = {f: pila.enter_context(rasterio.open(f, NUM_THREADS="ALL_CPUS"))
+                for f in history_files + [target_file]
+                if f == target_file or anio(f) not in loaded}
+        ref = srcs[target_file]
+        recorte, transform, fuera = _grilla_limite(ref)
+        alto, ancho = fuera.shape
+
+        def ndvi(f, win, filas, cols):
+            # Banda 1 (NDVI) del bloque: desde los índices ya cargados o leyendo el archivo
+            if anio(f) in loaded:
+                return loaded[anio(f)][0][0][filas, cols]
+            return _leer_bloque(srcs[f], [1], win, fuera[filas, cols])[0]
+
+        # Hilos para leer el mismo bloque de los distintos años en paralelo (cada
+        # archivo tiene su propio handle y solo un hilo lo usa a la vez; GDAL
+        # libera el GIL al descomprimir)
+        hilos = pila.enter_context(ThreadPoolExecutor(max_workers=min(len(history_files), os.cpu_count() or 1)))
+
+        # Salida escrita por bloques en un GeoTIFF teselado (directo a disco, sin
+        # armar el raster completo en memoria), copiado a COG al cerrar la pila
+        prof = dict(ref.profile, height=alto, width=ancho, transform=transform)
+        dst = pila.enter_context(_escribir_cog(out_path, prof, rasterio.float32, np.nan, 1))
+
+        # Recorre la grilla por bloques internos del año objetivo: para cada bloque
+        # lee la misma ventana de cada año histórico, sin apilar los años completos
+        for win, filas, cols in _bloques_recorte(ref, recorte):
+            forma = fuera[filas, cols].shape
+            # Serie histórica del bloque (años, filas, columnas), preasignada y
+            # llenada en su lugar por los hilos (sin lista intermedia ni copia final)
+            serie = np.empty((len(history_files),) + forma, dtype=np.float32)
+
+            def leer_anio(k):
+                serie[k] = ndvi(history_files[k], win, filas, cols)
+
+            list(hilos.map(leer_anio, range(len(history_files))))
+            current = ndvi(target_file, win, filas, cols)
+
+            # Media, desviación estándar y Z-Score en una sola pasada (ver _zscore_bloque)
+            if gpu:
+                z_score = cp.asnumpy(_zscore_bloque_xp(cp, cp.asarray(serie), cp.asarray(current)))
+            else:
+                z_score = np.empty(forma, dtype=np.float32)
+                _zscore_bloque(serie, current, z_score)
+            dst.write(z_score, 1, window=windows.Window(cols.start, filas.start, forma[1], forma[0]))
+
+        dst.update_tags(DESCRIPTION=f"NDVI Z-Score {target_year}")
+
+    # Registra la operación en el log
+    log_message(f"✔ Guardado: {out_path.name}")
 
 # ==============================================================================
 # PUNTO DE ENTRADA PRINCIPAL
@@ -453,9 +1005,16 @@ if __name__ == "__main__":
     parser.add_argument("--t2", type=int, default=2025, help="Año final (Target)")
     # Argumento: método(s) de detección a ejecutar
     parser.add_argument("--method", type=str, default="all", choices=["diff", "urban", "anomaly", "all"])
+    # Argumento: ejecutar los cálculos por píxel en GPU (requiere CuPy)
+    parser.add_argument("--gpu", action="store_true", help="Calcular en GPU con CuPy (si está instalado)")
     
     # Parsea los argumentos proporcionados
     args = parser.parse_args()
+
+    # GPU solo si se pidió y CuPy está disponible; si no, se usan los kernels en CPU
+    usar_gpu = args.gpu and cp is not None
+    if args.gpu and not usar_gpu:
+        print("AVISO: CuPy no está instalado, se calcula en CPU.")
     
     # -------------------------------------------------------------------------
     # VALIDACIONES DE ENTRADA
@@ -487,17 +1046,25 @@ if __name__ == "__main__":
     # -------------------------------------------------------------------------
     print(f"➤ Iniciando Detección de Cambios: {args.t1} -> {args.t2}")
     
+    # Carga una sola vez los índices de ambas fechas, compartidos por los métodos
+    loaded = {}
+    if args.method in ["diff", "urban", "all"]:
+        # (ambos años se leen en paralelo, cada uno con su propio handle)
+        with ThreadPoolExecutor(max_workers=2) as hilos:
+            loaded = dict(zip([args.t1, args.t2], hilos.map(load_indices, [args.t1, args.t2])))
+        (img_t1, profile), (img_t2, _) = loaded[args.t1], loaded[args.t2]
+
     # Ejecuta Método 1: Diferencia Simple (si se solicitó)
     if args.method in ["diff", "all"]:
-        method_difference(file_t1, file_t2, index_band=1, threshold=0.15)
+        method_difference(img_t1, img_t2, profile, args.t1, args.t2, index_band=1, threshold=0.15, gpu=usar_gpu)
     
     # Ejecuta Método 2: Clasificación Urbana (si se solicitó)
     if args.method in ["urban", "all"]:
-        method_urban_classification(file_t1, file_t2)
+        method_urban_classification(img_t1, img_t2, profile, args.t1, args.t2, gpu=usar_gpu)
     
     # Ejecuta Método 3: Anomalías Temporales (si se solicitó)
     if args.method in ["anomaly", "all"]:
-        method_anomaly(args.t2)
+        method_anomaly(args.t2, loaded, gpu=usar_gpu)
         
     # Mensaje de finalización
     print(f"\n✔ ✔ Proceso finalizado. Resultados en {OUTPUT_DIR}")
\ No newline at end of file
@@ -10,15 +10,27 @@
 
 # 1) Importación de librerías
 import ee # Para conectarse con Google Earth Engine (API de Python) y acceder a imágenes satelitales (como Sentinel-2).
-import geemap # Para la descarga de imágenes EE en archivos locales.
+import geedim # Para la descarga de imágenes EE en archivos locales (registra el accesor ee.Image.gd; por teselas, en paralelo).
 import os # Para el manejo de archivos.
 import sys # Para manejo de errores y salida del sistema
+import atexit # Para cerrar (y vaciar) el archivo de metadatos al terminar el proceso
 import shutil # Para mover archivos y limpiar directorios temporales (Plan B)
 from pathlib import Path # Para el manejo de rutas de archivos y directorios.
 from datetime import datetime # Para registrar la fecha y hora de generación de los metadatos.
+from concurrent.futures import ThreadPoolExecutor # Para descargar los años en paralelo.
 
 # 2) CONFIGURACIÓN
 DEFAULT_GEE_PROJECT = "composed-augury-451119-b6" # ID del proyecto compartido. Para acceder a Google Earth Engine
+# Endpoint de alto volumen de GEE: pensado para muchas solicitudes de descarga en
+# paralelo (getDownloadURL/computePixels), sin la limitación del endpoint por defecto
+GEE_HIGHVOLUME_URL = "https://earthengine-highvolume.googleapis.com"
+# Descarga por teselas (geedim divide la región y las descarga en paralelo):
+# teselas de a lo más 4 MB (en vez del límite de 32 MB por solicitud) y hasta 8
+# solicitudes de teselas a la vez por imagen
+DOWNLOAD_MAX_TILE_MB = 4
+DOWNLOAD_MAX_REQUESTS = 8
+# Umbral de probabilidad de nube (s2cloudless, 0-100): sobre este valor el píxel se enmascara
+CLOUD_PROB_MAX = 40
 # Enlace de respaldo a Google Drive (como plan B) con los TIFs ya procesados
 DRIVE_FOLDER_URL = "https://drive.google.com/drive/folders/1rjRRUQr6b-QIs79J05r7nMv4_mGzYcbT?usp=sharing"
 script_location = Path(__file__).parent.resolve() # Ubicación del script actual (scripts/download_sentinel.py)
@@ -32,10 +44,13 @@ print(f"Los datos se guardarán en: {output_dir}")
 
 # Reiniciar archivo de metadatos al iniciar el script
 # Abre el archivo en modo escritura ('w') para limpiarlo al inicio (si es que se generó anteriormente)
-with open(metadata_file, "w", encoding="utf-8") as f: # Usé UTF-8 para soportar caracteres especiales
-    f.write(f"METADATOS DE IMÁGENES SATELITALES\n")
-    f.write(f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n") # fecha y hora actual
-    f.write("="*50 + "\n\n")
+# El archivo queda abierto (con buffer de 64 KB) para todos los registros del
+# proceso, en vez de abrirlo y cerrarlo en cada año; se cierra al salir
+_metadata_fh = open(metadata_file, "w", buffering=1 << 16, encoding="utf-8") # Usé UTF-8 para soportar caracteres especiales
+atexit.register(_metadata_fh.close)
+_metadata_fh.write(f"METADATOS DE IMÁGENES SATELITALES\n")
+_metadata_fh.write(f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n") # fecha y hora actual
+_metadata_fh.write("="*50 + "\n\n")
 
 # 3) FUNCIONES AUXILIARES
 
@@ -49,22 +64,26 @@ def log_metadata(filename, year, source="GEE"):
         source (str): Fuente de la descarga ('GEE' o 'Google Drive Plan B').
     
     Salidas:
-        None: Escribe directamente en el archivo metadata.txt.
+        None: Escribe en el archivo metadata.txt (abierto durante todo el proceso).
     """
-    # Abre el archivo en modo 'append' ('a') para agregar sin borrar lo anterior
-    with open(metadata_file, "a", encoding="utf-8") as f:
-        f.write(f"Archivo: {filename}\n") # Nombre del archivo
-        f.write(f" - Fuente: {source}\n") # Fuente de datos
-        f.write(f" - Sensor: Sentinel-2 (COPERNICUS/S2_SR_HARMONIZED)\n") # Sensor y colección
-        f.write(f" - Año: {year}\n") # Año de la imagen
-        f.write(f" - Rango Temporal: 01 Enero - 30 Marzo (Verano)\n") # Rango temporal
-        f.write(f" - Filtro Nubosidad: < 30% (Pixel Percentage)\n") # Filtro de nubosidad
-        if source == "GEE":
-            f.write(f" - Procesamiento: Mediana temporal (Cloud Masking + Median Composite)\n")
-        else:
-            f.write(f" - Procesamiento: Pre-procesado (descarga directa desde Google Drive)\n")
-        f.write(f" - Bandas: B2, B3, B4, B8, B11, B12\n") # Bandas incluidas
-        f.write("-" * 30 + "\n")
+    # El registro se arma completo y se escribe de una vez en el archivo abierto
+    if source == "GEE":
+        procesamiento = " - Procesamiento: Mediana temporal (Cloud Masking + Median Composite)\n"
+    else:
+        procesamiento = " - Procesamiento: Pre-procesado (descarga directa desde Google Drive)\n"
+    registro = (
+        f"Archivo: {filename}\n" # Nombre del archivo
+        f" - Fuente: {source}\n" # Fuente de datos
+        f" - Sensor: Sentinel-2 (COPERNICUS/S2_SR_HARMONIZED)\n" # Sensor y colección
+        f" - Año: {year}\n" # Año de la imagen
+        f" - Rango Temporal: 01 Enero - 30 Marzo (Verano)\n" # Rango temporal
+        f" - Filtro Nubosidad: < 30% (Pixel Percentage)\n" # Filtro de nubosidad
+        + procesamiento
+        + f" - Bandas: B2, B3, B4, B8, B11, B12\n" # Bandas incluidas
+    )
+    if source == "GEE":
+        registro += f" - Valores: uint16 en DN, factor de escala 1/10000 (se aplica al leer)\n"
+    _metadata_fh.write(registro + "-" * 30 + "\n")
 
 def init_gee():
     """
@@ -79,7 +98,7 @@ def init_gee():
     print(f" Conectando a GEE con proyecto: {project}...")
     try:
         # Intenta inicializar directamente si ya hay credenciales cacheadas
-        ee.Initialize(project=project)
+        ee.Initialize(project=project, opt_url=GEE_HIGHVOLUME_URL)
         print(f"✔ GEE inicializado.")
         return True # <--- ¡AQUÍ ESTABA EL ERROR! Faltaba retornar True
     except Exception as e: # Si falla, intenta autenticarse
@@ -87,7 +106,7 @@ def init_gee():
         print("   Intentando autenticación interactiva...")
         try:
             ee.Authenticate()
-            ee.Initialize(project=project)
+            ee.Initialize(project=project, opt_url=GEE_HIGHVOLUME_URL)
             print(f"✔ GEE inicializado tras autenticación.")
             return True
         except Exception as e2: # Si falla de nuevo, avisa y retorna False
@@ -163,23 +182,124 @@ bands = ["B2", "B3", "B4", "B8", "B11", "B12"]
 
 def mask_clouds_s2(image):
     """
-    Descripción: Función que aplica una máscara de nubes y cirrus a una imagen Sentinel-2 usando la banda QA60.
-                 También escala los valores de reflectancia y selecciona las bandas de interés.
+    Descripción: Función que aplica una máscara de nubes a una imagen Sentinel-2 usando la probabilidad
+                 de nubes de s2cloudless (COPERNICUS/S2_CLOUD_PROBABILITY), unida previamente a la imagen
+                 en la propiedad 'cloud_mask' (ver coleccion_anio). A diferencia de los bits de QA60,
+                 también descarta neblina y bordes de nubes.
+                 También selecciona las bandas de interés. Los valores se mantienen en DN
+                 (reflectancia x 10000) para descargarlos como uint16; la división por 10000
+                 se aplica al leer (calculate_indices.py detecta las bandas enteras).
 
     Entradas:
-        image (ee.Image): Imagen original de la colección Sentinel-2.
+        image (ee.Image): Imagen original de la colección Sentinel-2 (con la propiedad 'cloud_mask').
 
     Salidas:
-        ee.Image: Imagen procesada, enmascarada y escalada (0-1).
+        ee.Image: Imagen procesada y enmascarada, en DN (0-10000).
     """
-    # Selecciona la banda de calidad QA60 que contiene flags de nubes
-    qa = image.select("QA60")
-    # Identifica bits correspondientes a nubes (bit 10) y cirrus (bit 11)
-    # bitwiseAnd chequea si esos bits son 0 (despejado)
-    cloud_mask = qa.bitwiseAnd(1 << 10).eq(0).And(qa.bitwiseAnd(1 << 11).eq(0))
-    # Aplica la máscara, divide por 10000 para obtener reflectancia (0-1), 
-    # selecciona bandas útiles y asegura rango 0-1 con clamp
-    return image.updateMask(cloud_mask).divide(10000).select(bands).clamp(0, 1).copyProperties(image, ["system:time_start"])
+    # Probabilidad de nube (0-100) de la imagen s2cloudless asociada
+    cloud_prob = ee.Image(image.get("cloud_mask")).select("probability")
+    # Píxel despejado si la probabilidad está bajo el umbral
+    cloud_mask = cloud_prob.lt(CLOUD_PROB_MAX)
+    # Aplica la máscara, selecciona bandas útiles y asegura rango 0-10000 (reflectancia 0-1) con clamp
+    return image.updateMask(cloud_mask).select(bands).clamp(0, 10000).copyProperties(image, ["system:time_start"])
+
+def coleccion_anio(year):
+    """
+    Descripción: Función que define la colección Sentinel-2 filtrada de un año.
+                 Cada imagen SR se une con su imagen de probabilidad de nubes (s2cloudless)
+                 por 'system:index', que es común a ambas colecciones.
+                 La máscara de nubes (mask_clouds_s2) no se aplica aquí: contar las imágenes
+                 solo requiere los metadatos, y mapear la máscara antes de size() obligaría al
+                 servidor a planificar el enmascarado de cada imagen solo para contarlas.
+
+    Entradas:
+        year (int): Año de la colección.
+
+    Salidas:
+        ee.ImageCollection: Colección filtrada, sin enmascarar (evaluación diferida, sin llamadas al servidor).
+    """
+    inicio, fin = f"{year}-01-01", f"{year}-03-30" # Rango de fechas (verano), aunque se considera un poco de Otoño
+    s2 = (
+        ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") # Selección de colección Sentinel-2 Surface Reflectance
+        .filterBounds(geometry) # Filtrar por área de interés (Viña del Mar)
+        .filterDate(inicio, fin) # Filtrar por rango de fechas
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 30)) # Filtrar por nubosidad < 30%
+    )
+    s2c = (
+        ee.ImageCollection("COPERNICUS/S2_CLOUD_PROBABILITY") # Probabilidad de nubes (s2cloudless)
+        .filterBounds(geometry)
+        .filterDate(inicio, fin)
+    )
+    # Une a cada imagen SR su imagen de probabilidad de nubes (propiedad 'cloud_mask')
+    unidas = ee.Join.saveFirst("cloud_mask").apply(
+        primary=s2,
+        secondary=s2c,
+        condition=ee.Filter.equals(leftField="system:index", rightField="system:index")
+    )
+    return ee.ImageCollection(unidas)
+
+def descargar_anio(year, count):
+    """
+    Descripción: Función que descarga el compuesto Sentinel-2 de un año desde GEE.
+                 Se ejecuta en paralelo para los distintos años (un hilo por año),
+                 ya que cada descarga pasa la mayor parte del tiempo esperando la red.
+
+    Entradas:
+        year (int): Año a descargar.
+        count (int | None): Número de imágenes de la colección tras filtros (calculado
+                     para los años pendientes en una sola consulta desde main);
+                     None si el archivo ya existía.
+
+    Salidas:
+        str | None: Nombre del archivo si quedó disponible (descargado o ya existente),
+                    None si no hubo imágenes o la descarga falló.
+    """
+    filename = f"sentinel2_{year}.tif" # Nombre del archivo de salida
+    output_path = output_dir / filename # Ruta completa del archivo de salida
+    
+    # Verificar existencia previa
+    if output_path.exists(): # Si el archivo ya existe
+        if output_path.stat().st_size > 1000: # Verifica que no esté corrupto (tamaño > 1KB)
+            print(f"✔ [YA EXISTE] {filename}") # Si ya existe, omite descarga
+            return filename
+        else: # Si el archivo es muy pequeño, asume que está corrupto y lo borra
+            os.remove(output_path) # Borrar archivo corrupto
+    
+    if count == 0:
+        print(f" [AVISO] Cero imágenes para {year}")
+        return None
+
+    # Definir colección y aplicar máscara de nubes y pre-procesamiento
+    collection = coleccion_anio(year).map(mask_clouds_s2)
+    
+    # Descargando la imagen compuesta
+    print(f"➤ [DESCARGANDO] {filename} (Usando {count} imágenes)...")
+    
+    # Reducción temporal (Mediana)
+    # Compuesto mediano para reducir ruido. La mediana se calcula en double, por lo que
+    # se redondea y se convierte a uint16: 2 bytes por píxel en vez de 4 (float32),
+    # la mitad de datos a transferir y a guardar
+    composite = collection.median().round().toUint16().clip(geometry)
+    
+    # Intentar descargar usando geedim
+    try:
+        # Malla de exportación (CRS, región y resolución) y luego descarga por teselas
+        exportable = composite.gd.prepareForExport(
+            crs='EPSG:32719', # Sistema de referencia de coordenadas UTM Zona 19S
+            region=geometry, # Región de interés (Viña del Mar)
+            scale=10 # Resolución espacial (10m para Sentinel-2)
+        )
+        exportable.gd.toGeoTIFF(
+            str(output_path), # Ruta de salida
+            overwrite=True, # Sobrescribir si ya existe
+            max_tile_size=DOWNLOAD_MAX_TILE_MB, # Tamaño máximo de cada tesela (MB)
+            max_requests=DOWNLOAD_MAX_REQUESTS # Teselas descargadas en paralelo
+        )
+        print(f" ✔ Éxito: {filename}") # Confirmación de descarga exitosa
+        return filename
+    except Exception as e: # En caso de errores en la descarga
+        print(f" ✘ Error en descarga GEE ({year}): {e}")
+        return None
 
 # 4) DESCARGA DE IMÁGENES SATELITALES
 # Comando de descarga: python scripts/download_sentinel.py
@@ -188,53 +308,27 @@ if __name__ == "__main__":
     if gee_disponible: # Si la conexión con GEE fue exitosa (Plan A)
         # Plan A: Descarga desde Google Earth Engine
         print(f"➤  Iniciando descarga oficial desde GEE...\n")
-        for year in years: # Para cada año (2019-2025)
-            filename = f"sentinel2_{year}.tif" # Nombre del archivo de salida
-            output_path = output_dir / filename # Ruta completa del archivo de salida
-            
-            # Verificar existencia previa
-            if output_path.exists(): # Si el archivo ya existe
-                if output_path.stat().st_size > 1000: # Verifica que no esté corrupto (tamaño > 1KB)
-                    print(f"✔ [YA EXISTE] {filename}") # Si ya existe, omite descarga
-                    log_metadata(filename, year)
-                    continue
-                else: # Si el archivo es muy pequeño, asume que está corrupto y lo borra
-                    os.remove(output_path) # Borrar archivo corrupto
-            
-            # Definir colección
-            collection = (
-                ee.ImageCollection("COPERNICUS/S2_SR_HARMONIZED") # Selección de colección Sentinel-2 Surface Reflectance
-                .filterBounds(geometry) # Filtrar por área de interés (Viña del Mar)
-                .filterDate(f"{year}-01-01", f"{year}-03-30") # Filtrar por rango de fechas (verano), aunque se considera un poco de Otoño
-                .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", 30)) # Filtrar por nubosidad < 30%
-                .map(mask_clouds_s2) # Aplicar máscara de nubes y pre-procesamiento
-            )
-            
-            count = collection.size().getInfo() # Contar número de imágenes tras filtros
-            if count == 0:
-                print(f" [AVISO] Cero imágenes para {year}")
-                continue
-            
-            # Descargando la imagen compuesta
-            print(f"➤ [DESCARGANDO] {filename} (Usando {count} imágenes)...")
-            
-            # Reducción temporal (Mediana)
-            composite = collection.median().clip(geometry) # Compuesto mediano para reducir ruido
-            
-            # Intentar descargar usando geemap
-            try:
-                geemap.download_ee_image( 
-                    composite, # Imagen a descargar
-                    filename=str(output_path), # Ruta de salida
-                    scale=10, # Resolución espacial (10m para Sentinel-2)
-                    region=geometry, # Región de interés (Viña del Mar)
-                    crs='EPSG:32719', # Sistema de referencia de coordenadas UTM Zona 19S
-                    overwrite=True # Sobrescribir si ya existe
-                )
-                print(f" ✔ Éxito: {filename}") # Confirmación de descarga exitosa
-                log_metadata(filename, year) # Registrar metadatos
-            except Exception as e: # En caso de errores en la descarga
-                print(f" ✘ Error en descarga GEE: {e}")
+        # Años pendientes: sin archivo previo válido (> 1KB). Se revisa antes de
+        # construir cualquier objeto ee, para que una re-ejecución con todo
+        # descargado no haga ninguna consulta al servidor
+        pendientes = [year for year in years
+                      if not (output_dir / f"sentinel2_{year}.tif").exists()
+                      or (output_dir / f"sentinel2_{year}.tif").stat().st_size <= 1000]
+        # Conteo de imágenes de los años pendientes en una sola consulta al servidor
+        # (una llamada getInfo() en vez de una por año antes de cada descarga)
+        conteos = {}
+        if pendientes:
+            conteos = dict(zip(pendientes, ee.List([coleccion_anio(year).size() for year in pendientes]).getInfo()))
+        # Todos los años se descargan a la vez (uno por hilo). Se usan hilos y no
+        # procesos porque la espera es de red, y porque en Windows cada proceso
+        # volvería a importar el script (reiniciando metadata.txt y la sesión GEE)
+        with ThreadPoolExecutor(max_workers=len(years)) as executor:
+            resultados = dict(zip(years, executor.map(descargar_anio, years, [conteos.get(year) for year in years])))
+
+        # Registrar metadatos en orden de año, desde el hilo principal
+        for year in years:
+            if resultados[year]:
+                log_metadata(resultados[year], year)
                 
     else: # Si la conexión con Google Earth Engine falló
         # Descarga desde Google Drive (Plan B)
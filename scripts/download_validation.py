@@ -21,7 +21,7 @@
 
 # 1) Importación de librerías
 import ee # para conectar con API de Google Earth Engine para acceso a catálogos de imágenes satelitales
-import geemap # para la descarga de imágenes desde GEE a archivos locales
+import geedim # para la descarga de imágenes desde GEE a archivos locales (registra el accesor ee.Image.gd; por teselas, en paralelo)
 import os # para interactuar con variables de entorno del sistema
 from pathlib import Path # para la manipulación de rutas de archivos (de forma multiplataforma)
 
@@ -30,6 +30,17 @@ from pathlib import Path # para la manipulación de rutas de archivos (de forma
 # 2) Configuración de rutas y proyecto GEE
 # Proyecto de Google Earth Engine (reemplazar con el propio si es necesario)
 DEFAULT_GEE_PROJECT = "composed-augury-451119-b6" 
+# Endpoint de alto volumen de GEE: pensado para muchas solicitudes de descarga en
+# paralelo (getDownloadURL/computePixels), sin la limitación del endpoint por defecto
+GEE_HIGHVOLUME_URL = "https://earthengine-highvolume.googleapis.com"
+# Descarga por teselas (geedim divide la región y las descarga en paralelo):
+# teselas de a lo más 4 MB (en vez del límite de 32 MB por solicitud) y hasta 8
+# solicitudes de teselas a la vez
+DOWNLOAD_MAX_TILE_MB = 4
+DOWNLOAD_MAX_REQUESTS = 8
+# Valor sin datos de las referencias: 255, fuera del rango de clases 0-8 (el nodata
+# por defecto de uint8 es 0, que coincide con la clase 0 = Water)
+DW_NODATA = 255
 # Obtiene la ruta absoluta del directorio donde está este script
 script_location = Path(__file__).parent.resolve()
 # Define el directorio de salida para los datos de validación
@@ -65,13 +76,13 @@ def init_gee():
     project = os.environ.get('EE_PROJECT') or DEFAULT_GEE_PROJECT
     try:
         # Intenta inicializar con las credenciales existentes
-        ee.Initialize(project=project)
+        ee.Initialize(project=project, opt_url=GEE_HIGHVOLUME_URL)
         print(f"✔ GEE inicializado.")
     except Exception:
         # Si falla, solicita autenticación interactiva (abre navegador)
         ee.Authenticate()
         # Reintenta la inicialización después de autenticar
-        ee.Initialize(project=project)
+        ee.Initialize(project=project, opt_url=GEE_HIGHVOLUME_URL)
 
 # Ejecuta la inicialización de GEE al cargar el módulo
 init_gee()
@@ -114,7 +125,11 @@ def get_dynamic_world_class(start_date, end_date):
     
     # Calcula la moda (valor más frecuente) para evitar efectos de nubes
     # reduce() aplica el reductor a toda la colección temporal
-    classification = dw.reduce(ee.Reducer.mode()).clip(geometry)
+    # La moda sale en double; como las clases son 0-8 se convierte a uint8, con lo
+    # que el GeoTIFF descargado ocupa 1 byte por píxel (en vez de 8 en float64).
+    # Antes, los píxeles sin datos (y fuera del área) se rellenan con DW_NODATA, para
+    # que no se confundan con la clase 0 (Water)
+    classification = dw.reduce(ee.Reducer.mode()).clip(geometry).unmask(DW_NODATA).uint8()
     return classification
 
 # ==============================================================================
@@ -148,14 +163,19 @@ for year, start, end in years_ranges:
     image = get_dynamic_world_class(start, end)
     
     try:
-        # Descarga la imagen usando geemap con los parámetros especificados
-        geemap.download_ee_image(
-            image,
-            filename=str(output_path),
-            scale=10,  # Resolución de 10 metros (igual que Sentinel-2)
-            region=geometry,  # Área de estudio definida
+        # Descarga la imagen usando geedim con los parámetros especificados
+        # Malla de exportación (CRS, región y resolución) y luego descarga por teselas
+        exportable = image.gd.prepareForExport(
             crs='EPSG:32719',  # Sistema de coordenadas UTM Zona 19S (Chile central)
-            overwrite=True  # Sobrescribe si existe (aunque ya verificamos arriba)
+            region=geometry,  # Área de estudio definida
+            scale=10  # Resolución de 10 metros (igual que Sentinel-2)
+        )
+        exportable.gd.toGeoTIFF(
+            str(output_path),  # Ruta de salida
+            overwrite=True,  # Sobrescribe si existe (aunque ya verificamos arriba)
+            nodata=DW_NODATA,  # Etiqueta nodata del GeoTIFF (valor de relleno de unmask)
+            max_tile_size=DOWNLOAD_MAX_TILE_MB,  # Tamaño máximo de cada tesela (MB)
+            max_requests=DOWNLOAD_MAX_REQUESTS  # Teselas descargadas en paralelo
         )
         print(f"✔ Éxito: {filename}")
     except Exception as e:
@@ -173,6 +193,7 @@ readme_path = output_dir / "README_CLASSES.txt"
 with open(readme_path, "w") as f:
     f.write("CLASES DYNAMIC WORLD:\n")
     f.write("0: Water\n1: Trees\n2: Grass\n3: Flooded Vegetation\n")
-    f.write("4: Crops\n5: Shrub & Scrub\n6: Built (Urbano)\n7: Bare (Suelo)\n8: Snow & Ice")
+    f.write("4: Crops\n5: Shrub & Scrub\n6: Built (Urbano)\n7: Bare (Suelo)\n8: Snow & Ice\n")
+    f.write(f"{DW_NODATA}: Sin datos (nodata)")
 
 print("\n✔ ✔ Datos de validación listos.")
\ No newline at end of file
@@ -10,22 +10,42 @@
 # Librerías
 import argparse        # Para manejar argumentos de línea de comandos para controlar el flujo del script
 import requests        # Para realizar solicitudes HTTP para descargar datos desde APIs y URLs
+from requests.adapters import HTTPAdapter # Para configurar el pool de conexiones de la sesión HTTP
+from urllib3.util.retry import Retry # Para reintentar peticiones ante errores transitorios
+import pandas as pd     # Para unir las páginas descargadas de la API del Censo
 import geopandas as gpd # Para procesar datos vectoriales geoespaciales (shapefile, geojson, gpkg)
+import pyogrio          # Para leer el esquema de las capas y filtrar en GDAL (where/bbox)
+from shapely.geometry import box # Para construir el rectángulo de la extensión de la comuna
 import osmnx as ox     # Para descargar y manipular datos geográficos de OpenStreetMap (límites, calles)
 import zipfile         # Para leer y extraer archivos comprimidos ZIP
 import io              # Para manejar flujos de datos en memoria (bytes, buffers)
+import re              # Para filtrar por nombre los ZIP del respaldo en Drive
 import shutil          # Para operaciones de alto nivel sobre archivos y carpetas (copiar, borrar)
 import gdown           # Para descargar archivos y carpetas directamente desde Google Drive
 import unicodedata     # Para normalizar texto Unicode (eliminar tildes, acentos, caracteres especiales)
 import json            # Para manejar datos en formato JSON (lectura y escritura)
 import warnings        # Para controlar y filtrar mensajes de advertencia de librerías
+import time            # Para esperar entre reintentos de las consultas a OpenStreetMap
+import threading       # Para serializar la escritura de metadatos entre hilos y borrar temporales en segundo plano
+import uuid            # Para nombrar de forma única las carpetas temporales por borrar
+import atexit          # Para cerrar (y vaciar) el archivo de metadatos al terminar el proceso
+from concurrent.futures import ThreadPoolExecutor # Para ejecutar los módulos de descarga en paralelo
 from pathlib import Path # Para el manejo moderno y multiplataforma de rutas de archivos
 from tqdm import tqdm  # Para mostrar barras de progreso en bucles largos (descargas)
 from datetime import datetime # Para el manejo de fechas y horas para registro de metadatos
+try: # Opcional: caché HTTP persistente (si no está instalada, se usa una sesión normal)
+    import requests_cache # Para guardar en disco las respuestas HTTP y revalidarlas (ETag/Last-Modified)
+except ImportError:
+    requests_cache = None
 
 # Ignorar advertencias
 warnings.filterwarnings("ignore")
 
+# Motor de lectura/escritura vectorial: pyogrio (lee y escribe columnas completas
+# vía GDAL, en vez del recorrido objeto por objeto de Fiona). Junto con
+# use_arrow=True, los datos pasan de GDAL a pandas como tablas Arrow
+gpd.options.io_engine = "pyogrio"
+
 # 1) Configuración global
 COMUNA_OBJETIVO = "VIÑA DEL MAR"
 
@@ -33,23 +53,81 @@ COMUNA_OBJETIVO = "VIÑA DEL MAR"
 URL_DPA_DIRECTA = "https://www.geoportal.cl/geoportal/catalog/download/912598ad-ac92-35f6-8045-098f214bd9c2" # Descarga directa de DPA
 URL_DPA_DRIVE = "https://drive.google.com/drive/folders/10Gu5WlkQBlvkL25cpUQfOurOURu_MEov?usp=sharing" # Respaldo en Drive
 URL_CENSO_API = "https://services5.arcgis.com/hUyD8u3TeZLKPe4T/arcgis/rest/services/Manzana_2017_2/FeatureServer/0" # API del Censo 2017
+CENSO_PAGINA = 1000 # Entidades por página en las consultas a la API del Censo
+CENSO_HILOS = 4 # Páginas descargadas en paralelo
+# Campos pedidos a la API del Censo: solo los que se usan aguas abajo (la comuna y el
+# identificador de manzana, columna de zona del análisis zonal), en vez de las decenas de
+# campos de población y vivienda de la capa, que multiplican el tamaño de cada página
+CENSO_CAMPOS = "COMUNA,MANZENT"
+
+# Extensión aproximada de la comuna (lon/lat WGS84, la misma de download_sentinel.py).
+# Se usa para leer del shapefile nacional solo las comunas que la intersectan y para
+# consultar la red vial en OpenStreetMap
+BBOX_COMUNA = (-71.607, -33.125, -71.423, -32.925)
 
 # Rutas
 SCRIPT_DIR = Path(__file__).parent.resolve() # Carpeta del script actual
 VECTOR_DIR = SCRIPT_DIR.parent / "data" / "vector" # Carpeta de salida para vectores
 TEMP_DIR = VECTOR_DIR / "temp_download" # Carpeta temporal para descargas intermedias
 METADATA_FILE = VECTOR_DIR / "metadata.txt" # Archivo de metadatos
+CHUNK_DESCARGA = 1 << 20 # Tamaño de chunk de escritura en descargas completas (1 MiB, menos llamadas al sistema que 8 KiB)
+CHUNK_RANGO = 1 << 16 # Tamaño mínimo de cada petición por rango al leer un ZIP remoto (64 KiB)
+GPKG_SIN_INDICE = {"SPATIAL_INDEX": "NO"} # Opciones de capa GPKG para salidas de un solo registro (límite comunal)
+HTTP_CACHE_FILE = VECTOR_DIR / "http_cache.sqlite" # Caché de respuestas HTTP (requiere requests-cache)
+HTTP_CACHE_EXPIRA = 86400 # Vigencia de las respuestas en caché sin revalidar (segundos, 1 día)
+
+# Sesión HTTP compartida por todo el script: reutiliza las conexiones TCP/TLS
+# (keep-alive) entre peticiones al mismo servidor, en vez de abrir una por llamada
+# Con requests-cache, además, las respuestas (ZIP del IDE, rangos del ZIP y páginas de la
+# API del Censo) quedan en una caché SQLite: al repetir el script se sirven desde disco y,
+# vencidas, se revalidan con una petición condicional (If-None-Match/If-Modified-Since),
+# de modo que un archivo sin cambios en el servidor cuesta una respuesta 304 sin cuerpo.
+# La cabecera Range forma parte de la clave, para no confundir trozos del mismo archivo
+if requests_cache is not None:
+    SESSION = requests_cache.CachedSession(
+        str(HTTP_CACHE_FILE), backend="sqlite", cache_control=True,
+        expire_after=HTTP_CACHE_EXPIRA, allowable_codes=(200, 206), match_headers=["Range"])
+else:
+    SESSION = requests.Session()
+# Pool de conexiones por servidor (los módulos corren en hilos en paralelo) y
+# reintentos con espera exponencial ante errores transitorios (429/5xx), para no
+# caer al respaldo siguiente por un corte momentáneo
+_ADAPTADOR = HTTPAdapter(pool_connections=4, pool_maxsize=10,
+                         max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)))
+SESSION.mount("https://", _ADAPTADOR)
+SESSION.mount("http://", _ADAPTADOR)
+
+# Caché de OSMnx: las respuestas de Nominatim (geocodificación) y Overpass (calles)
+# se guardan en disco, fuera de TEMP_DIR para que cleanup_temp() no las borre, de modo
+# que repetir el script (ej: tras un fallo a medio guardar) no vuelve a consultar la API
+OSMNX_CACHE_DIR = VECTOR_DIR / "osmnx_cache"
+OSM_INTENTOS = 4 # Intentos por consulta a Nominatim/Overpass ante errores de red transitorios
+OSM_ESPERA = 2 # Espera inicial entre intentos (segundos, se duplica en cada reintento, máx. 30)
+GRAFO_RED_VIAL = OSMNX_CACHE_DIR / "red_vial_drive.graphml" # Grafo descargado, antes de convertir y guardar
+ox.settings.use_cache = True
+ox.settings.cache_folder = str(OSMNX_CACHE_DIR)
+ox.settings.requests_timeout = 180 # Segundos (Overpass puede tardar en responder)
+
+# Candado para metadata.txt: los módulos corren en hilos distintos y sus
+# registros no deben intercalarse
+_LOCK_METADATA = threading.Lock()
 
 # Crear carpetas necesarias
 VECTOR_DIR.mkdir(parents=True, exist_ok=True) # Crear carpeta de vectores si no existe
 TEMP_DIR.mkdir(parents=True, exist_ok=True) # Crear carpeta temporal si no existe
 
 # Reiniciar metadatos, para que no se sobreescriban con ejecuciones anteriores
-with open(METADATA_FILE, "w", encoding="utf-8") as f: # Abrir en modo escritura (sobrescribe)
-    f.write(f"METADATOS DE VECTORES\n")
-    f.write(f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n") # Fecha y hora de generación
-    f.write("="*50 + "\n\n")
+# El archivo queda abierto (con buffer de 64 KB) para todos los registros del
+# proceso, en vez de abrirlo y cerrarlo en cada uno; se cierra al salir
+_METADATA_FH = open(METADATA_FILE, "w", buffering=1 << 16, encoding="utf-8") # Abrir en modo escritura (sobrescribe)
+atexit.register(_METADATA_FH.close)
+_METADATA_FH.write(f"METADATOS DE VECTORES\n")
+_METADATA_FH.write(f"Generado el: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n") # Fecha y hora de generación
+_METADATA_FH.write("="*50 + "\n\n")
+
 
+# Tabla de traducción precalculada para las tildes del español (usada por normalize)
+_TABLA_TILDES = str.maketrans("áéíóúÁÉÍÓÚñÑüÜ", "aeiouAEIOUnNuU")
 
 # 2) Funciones de utilidad
 def normalize(text: str) -> str:
@@ -65,10 +143,14 @@ def normalize(text: str) -> str:
     """
     if text is None: return "" # Si el texto es None, retornar cadena vacía
     text = str(text) # Asegurar que es string
-    # Descompone caracteres unicode (ej: 'ñ' -> 'n' + '~')
-    text = unicodedata.normalize("NFKD", text)
-    # Filtra los caracteres combinados (tildes) y une el string
-    text = "".join(c for c in text if not unicodedata.combining(c))
+    # Reemplaza las tildes del español con la tabla precalculada (sin recorrer
+    # el texto carácter por carácter en Python)
+    text = text.translate(_TABLA_TILDES)
+    if not text.isascii():
+        # Otros caracteres acentuados: descompone unicode (ej: 'ç' -> 'c' + '¸')
+        text = unicodedata.normalize("NFKD", text)
+        # Filtra los caracteres combinados (tildes) y une el string
+        text = "".join(c for c in text if not unicodedata.combining(c))
     return text.upper().strip() # Retorna texto en mayúsculas y sin espacios extra
 
 def cleanup_temp(force_create=False):
@@ -79,9 +161,13 @@ def cleanup_temp(force_create=False):
         force_create (bool): Si es True, vuelve a crear la carpeta vacía después de borrarla.
     """
     try:
-        # Borra el árbol de directorios temporal si existe
+        # Si existe, la carpeta temporal se renombra (operación inmediata) y se borra en un
+        # hilo aparte, para no esperar a que se eliminen todos sus archivos antes de seguir
+        # con la siguiente descarga. El hilo no es daemon: el proceso espera a que termine
         if TEMP_DIR.exists():
-            shutil.rmtree(TEMP_DIR)
+            basura = TEMP_DIR.with_name(f".{TEMP_DIR.name}-{uuid.uuid4().hex}")
+            TEMP_DIR.rename(basura)
+            threading.Thread(target=shutil.rmtree, args=(basura,), kwargs={"ignore_errors": True}).start()
         # Vuelve a crear la carpeta limpia si se requiere
         if force_create:
             TEMP_DIR.mkdir(parents=True, exist_ok=True)
@@ -100,13 +186,140 @@ def log_metadata(filename, source, description):
     Salidas:
         None: Solo registra la información en el archivo de metadatos.
     """
-    with open(METADATA_FILE, "a", encoding="utf-8") as f:
-        f.write(f"Archivo: {filename}\n") # Nombre del archivo
-        f.write(f" - Fuente: {source}\n") # Fuente de los datos
-        f.write(f" - Descripción: {description}\n") # Descripción del contenido
-        # Registro el CRS estándar del proyecto
-        f.write(f" - CRS: EPSG:32719 (WGS 84 / UTM zone 19S)\n")
-        f.write("-" * 30 + "\n")
+    # El registro se arma completo y se escribe de una vez en el archivo abierto
+    registro = (
+        f"Archivo: {filename}\n" # Nombre del archivo
+        f" - Fuente: {source}\n" # Fuente de los datos
+        f" - Descripción: {description}\n" # Descripción del contenido
+        f" - CRS: EPSG:32719 (WGS 84 / UTM zone 19S)\n" # Registro el CRS estándar del proyecto
+        + "-" * 30 + "\n"
+    )
+    with _LOCK_METADATA:
+        _METADATA_FH.write(registro)
+
+class ArchivoRemoto(io.RawIOBase):
+    """
+    Descripción: Archivo de solo lectura sobre una URL, en el que cada lectura se resuelve con una
+                 petición HTTP con cabecera 'Range'. Permite abrir un ZIP remoto con zipfile y
+                 descargar solo el directorio central y los miembros que se extraen.
+
+    Entradas:
+        url (str): URL final del archivo (tras redirecciones).
+        size (int): Tamaño total del archivo en bytes (Content-Length).
+    """
+    def __init__(self, url, size):
+        self.url, self.size, self.pos = url, size, 0
+
+    def readable(self): return True
+    def seekable(self): return True
+    def tell(self): return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Mueve la posición de lectura (desde el inicio, la posición actual o el final)
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def readinto(self, b):
+        # Pide al servidor solo el rango [pos, pos + len(b)) del archivo
+        fin = min(self.pos + len(b), self.size)
+        if fin <= self.pos: return 0 # Fin de archivo
+        r = SESSION.get(self.url, headers={"Range": f"bytes={self.pos}-{fin - 1}"}, timeout=60)
+        r.raise_for_status()
+        if r.status_code != 206: raise IOError("El servidor ignoró la petición por rango")
+        n = len(r.content)
+        b[:n] = r.content
+        self.pos += n
+        return n
+
+def abrir_zip_remoto(url):
+    """
+    Descripción: Función que prepara un ZIP remoto para leerlo con zipfile. Si el servidor acepta
+                 peticiones por rango, el ZIP se lee bajo demanda (solo se descargan los bytes
+                 de los miembros extraídos); si no, se descarga completo a memoria.
+
+    Entradas:
+        url (str): URL del archivo ZIP.
+
+    Salidas:
+        file-like: Objeto binario con seek/read, apto para zipfile.ZipFile.
+    """
+    h = SESSION.head(url, allow_redirects=True, timeout=60) # Consulta cabeceras (sigue redirecciones)
+    size = int(h.headers.get('content-length', 0))
+    if h.ok and h.headers.get('accept-ranges', '').lower() == 'bytes' and size > 0:
+        print("    Servidor acepta rangos: se descargan solo las partes necesarias del ZIP")
+        # El buffer agrupa las lecturas pequeñas de zipfile en peticiones de 64 KiB
+        return io.BufferedReader(ArchivoRemoto(h.url, size), buffer_size=CHUNK_RANGO)
+
+    # Sin rangos: descarga completa con stream para barra de progreso
+    r = SESSION.get(url, stream=True, timeout=60)
+    r.raise_for_status() # Lanza error si la respuesta no es 200 OK
+    total_size = int(r.headers.get('content-length', 0)) # Tamaño total para la barra de progreso
+    # El ZIP se acumula en memoria (no se escribe en disco para volver a leerlo)
+    buffer = io.BytesIO()
+    with tqdm(total=total_size, unit='iB', unit_scale=True, desc="Descargando") as bar:
+        # Escritura en chunks de 1 MiB
+        for chunk in r.iter_content(chunk_size=CHUNK_DESCARGA):
+            size = buffer.write(chunk) # Escribe el chunk en el buffer
+            bar.update(size) # Actualiza la barra de progreso
+    return buffer
+
+def extraer_capa_comunas(zf, destino):
+    """
+    Descripción: Función que extrae de un ZIP solo las partes (.shp, .dbf, .shx, .prj, ...) de la
+                 capa de comunas, en vez de todo el paquete DPA nacional (regiones, provincias, ...).
+                 Si el ZIP no contiene una capa '*OMUNA*.shp', extrae todo su contenido.
+
+    Entradas:
+        zf (zipfile.ZipFile): Archivo ZIP abierto para lectura.
+        destino (Path): Carpeta donde extraer los archivos.
+    """
+    nombres = zf.namelist()
+    capas = {Path(n).with_suffix("") for n in nombres if "OMUNA" in n.upper() and n.lower().endswith(".shp")}
+    miembros = [n for n in nombres if Path(n).with_suffix("") in capas]
+    zf.extractall(destino, members=miembros or None) # Sin capa de comunas: extrae todo
+
+def serializar_columnas_complejas(gdf):
+    """
+    Descripción: Función que serializa a texto JSON los valores lista/dict de un GeoDataFrame
+                 (ej: atributos de OSM con varios valores), incompatibles con GPKG. Solo se
+                 revisan las columnas de tipo objeto, todas sus filas, en vez de descartar la
+                 columna completa.
+
+    Entradas:
+        gdf (GeoDataFrame): Capa a limpiar (se modifica en el lugar).
+
+    Salidas:
+        GeoDataFrame: La misma capa, con las columnas complejas como texto.
+    """
+    complejas = [c for c in gdf.select_dtypes(include="object").columns
+                 if gdf[c].map(lambda v: isinstance(v, (list, dict))).any()]
+    for c in complejas:
+        gdf[c] = gdf[c].map(lambda v: json.dumps(v, ensure_ascii=False, default=str) if isinstance(v, (list, dict)) else v)
+    return gdf
+
+def con_reintentos(funcion, *args, **kwargs):
+    """
+    Descripción: Función que ejecuta una consulta de OSMnx (Nominatim/Overpass) reintentándola con
+                 espera exponencial ante errores de red transitorios (cortes, timeouts, 5xx), en vez
+                 de que un solo fallo momentáneo haga fallar el módulo completo. Los errores que no
+                 son de red (ej: lugar no encontrado) se propagan de inmediato.
+
+    Entradas:
+        funcion (callable): Función de OSMnx a ejecutar (ej: ox.geocode_to_gdf).
+        *args, **kwargs: Argumentos de la función.
+
+    Salidas:
+        Any: Resultado de la función.
+    """
+    for intento in range(1, OSM_INTENTOS + 1):
+        try:
+            return funcion(*args, **kwargs)
+        except (requests.exceptions.RequestException, ConnectionError, TimeoutError) as e:
+            if intento == OSM_INTENTOS: raise # Sin más intentos: propaga el error
+            espera = min(OSM_ESPERA * 2 ** (intento - 1), 30)
+            print(f"    Error de red ({e}). Reintentando en {espera} s ({intento}/{OSM_INTENTOS - 1})...")
+            time.sleep(espera)
 
 # ==============================================================================
 # Módulo 1: Descarga de Límites Comunales (IDE Chile)
@@ -138,29 +351,55 @@ def download_limites():
             Salidas:
                 bool: True si se encontró y guardó el shapefile correctamente, False en caso contrario
         """
-        # Busca archivos .shp recursivamente
-        shapefiles = list(directorio.rglob("*OMUNA*.shp")) or list(directorio.rglob("*.shp"))
-        if not shapefiles: raise FileNotFoundError("No hay .shp") # Si no hay shapefiles, lanza error
-        # Toma el primer shapefile encontrado
-        shp = shapefiles[0]
+        # Busca recursivamente el primer .shp (de comunas, si hay), deteniendo el
+        # recorrido en la primera coincidencia en vez de listar todo el árbol
+        shp = next(directorio.rglob("*OMUNA*.shp"), None) or next(directorio.rglob("*.shp"), None)
+        if shp is None: raise FileNotFoundError("No hay .shp") # Si no hay shapefiles, lanza error
         print(f"   Leyendo: {shp.name}")
-        gdf = gpd.read_file(shp) # Carga el vector en memoria
-        # Busca dinámicamente la columna del nombre de la comuna
-        col_name = next((c for c in gdf.columns if c in ["COMUNA", "NOM_COM", "NOM_COMUNA"]), None)
+        # Busca dinámicamente la columna del nombre de la comuna en el esquema de la
+        # capa (solo metadatos, sin leer entidades); candidatas en orden de prioridad
+        columnas = set(pyogrio.read_info(shp)["fields"])
+        col_name = next((c for c in ("COMUNA", "NOM_COM", "NOM_COMUNA") if c in columnas), None)
         # Si no se encuentra la columna, lanza error
         if not col_name: raise ValueError("Columna de nombre no encontrada")
         # Indica la columna usada para filtrar
         print(f"   Filtrando '{COMUNA_OBJETIVO}'...")
-        # Filtra el GeoDataFrame
-        gdf_vina = gdf[gdf[col_name].astype(str).str.contains(COMUNA_OBJETIVO, case=False, na=False)]
+        # Filtro por nombre aplicado por GDAL durante la lectura (cláusula where):
+        # ILIKE ignora mayúsculas y cada letra no ASCII (ej: 'Ñ') se reemplaza por el
+        # comodín '%', para encontrar el nombre con o sin tildes en el origen
+        patron = "".join(c if c.isascii() else "%" for c in COMUNA_OBJETIVO)
+        where = f"\"{col_name}\" ILIKE '%{patron}%'"
+        # Además del filtro espacial: solo las comunas que intersectan la extensión de
+        # la comuna objetivo. El bbox va como GeoSeries con CRS para que geopandas lo
+        # reproyecte al CRS de la capa. Así se leen solo las entidades buscadas, en
+        # vez de la capa nacional completa
+        bbox = gpd.GeoSeries([box(*BBOX_COMUNA)], crs="EPSG:4326")
+        gdf = gpd.read_file(shp, engine="pyogrio", bbox=bbox, where=where, use_arrow=True)
+        # Verificación exacta sobre las pocas filas leídas (el comodín '%' es más amplio):
+        # normaliza la columna con las operaciones de texto de pandas (NFKD + descarte
+        # de lo no ASCII = sin tildes, y mayúsculas)
+        nombres = (gdf[col_name].astype("string").str.normalize("NFKD")
+                   .str.encode("ascii", "ignore").str.decode("ascii").str.upper())
+        # Filtra el GeoDataFrame por igualdad exacta con el nombre normalizado (con o sin
+        # tildes en el origen): comparación vectorizada, sin búsqueda de subcadenas, y sin
+        # aceptar otros nombres que lo contengan
+        gdf_vina = gdf[nombres.str.strip().eq(normalize(COMUNA_OBJETIVO)).fillna(False)]
         # Si no se encuentra la comuna en el shapefile, lanza error
         if gdf_vina.empty: raise ValueError("Comuna no encontrada")
+        # Solo el nombre y la geometría: el resto de atributos de la DPA (códigos de región,
+        # provincia, áreas, ...) no se usa aguas abajo, donde solo se lee el polígono
+        gdf_vina = gdf_vina[[col_name, "geometry"]]
+        # Si la comuna viene en varias filas (ej: partes separadas), se une en una sola
+        # entidad (MULTIPOLYGON), sin atributos duplicados
+        if len(gdf_vina) > 1:
+            gdf_vina = gdf_vina.dissolve(by=col_name, as_index=False)
         # Reproyecta a UTM 19S (EPSG:32719) para estandarizar coordenadas métricas
         if gdf_vina.crs.to_string() != "EPSG:32719":
             print("    Reproyectando a UTM 19S...")
             gdf_vina = gdf_vina.to_crs("EPSG:32719")
-        # Guarda el resultado en formato GeoPackage
-        gdf_vina.to_file(output_file, driver="GPKG")
+        # Guarda el resultado en formato GeoPackage, sin índice espacial (R-tree): la
+        # capa tiene un solo polígono, así que construirlo no aporta nada
+        gdf_vina.to_file(output_file, driver="GPKG", use_arrow=True, layer_options=GPKG_SIN_INDICE)
         print(f"   ✔ Guardado en: {output_file.name}")
         log_metadata("limite_comuna.gpkg", "IDE Chile / GeoPortal", "División Político Administrativa (DPA) 2020")
         return True # Se retorna true, como completado exitosamente
@@ -169,22 +408,12 @@ def download_limites():
     try:
         print("   1)  Intento IDE Chile Directo...")
         cleanup_temp(force_create=True) # Limpia y crea carpeta temporal
-        zip_temp_path = TEMP_DIR / "dpa_temp.zip"
-        # Petición HTTP con stream para barra de progreso
-        r = requests.get(URL_DPA_DIRECTA, stream=True, timeout=60)
-        r.raise_for_status() # Lanza error si la respuesta no es 200 OK
-        total_size = int(r.headers.get('content-length', 0)) # Tamaño total para la barra de progreso
-        # Escritura del archivo por chunks
-        with open(zip_temp_path, 'wb') as f, tqdm(total=total_size, unit='iB', unit_scale=True, desc="Descargando") as bar:
-            # Escritura en chunks de 8KB
-            for chunk in r.iter_content(chunk_size=8192):
-                size = f.write(chunk) # Escribe el chunk en el archivo
-                bar.update(size) # Actualiza la barra de progreso
-        # Descompresión del ZIP descargado
-        with zipfile.ZipFile(zip_temp_path, 'r') as z:
-            z.extractall(TEMP_DIR) # Extrae todo el contenido en la carpeta temporal
+        # ZIP remoto (leído por rangos) o descargado completo a memoria
+        archivo_zip = abrir_zip_remoto(URL_DPA_DIRECTA)
+        # Descompresión del ZIP
+        with zipfile.ZipFile(archivo_zip, 'r') as z:
+            extraer_capa_comunas(z, TEMP_DIR) # Extrae la capa de comunas
         # Procesa el shapefile extraído
-        zip_temp_path.unlink() # Borrar ZIP
         if procesar_shp(TEMP_DIR): return # Si se procesa correctamente, termina la función
 
     except Exception as e:
@@ -194,11 +423,29 @@ def download_limites():
     try:
         print("   2)  Intento Google Drive (Respaldo)...")
         cleanup_temp(force_create=True) # Limpia y crea carpeta temporal
-        # Descarga carpeta drive usando librería gdown
-        gdown.download_folder(url=URL_DPA_DRIVE, output=str(TEMP_DIR), quiet=False, use_cookies=False)
-        # Descomprime todos los zips encontrados
-        for z in TEMP_DIR.rglob("*.zip"):
-            with zipfile.ZipFile(z, 'r') as zf: zf.extractall(TEMP_DIR) # Extrae todo el contenido en la carpeta temporal
+        # Lista el contenido de la carpeta Drive con gdown, sin descargarlo (remaining_ok:
+        # no falla si la carpeta supera el límite de archivos que lista gdown)
+        archivos = gdown.download_folder(url=URL_DPA_DRIVE, output=str(TEMP_DIR), quiet=True, use_cookies=False,
+                                         remaining_ok=True, skip_download=True)
+        # Solo los zips de la DPA / comunas (si ninguno coincide, todos)
+        zips = [f for f in archivos if f.path.lower().endswith(".zip")]
+        zips = [f for f in zips if re.search(r"COMUNA|DPA", Path(f.path).name, re.I)] or zips
+        if zips:
+            # Cada zip se descarga a memoria (sin escribirlo en disco para volver a leerlo)
+            # y se descomprime en un hilo (zlib libera el GIL al descomprimir), en su propia
+            # carpeta, para que dos zips con archivos del mismo nombre no se escriban a la
+            # vez sobre el mismo destino
+            def extraer_zip(f):
+                print(f"    Descargando: {f.path}")
+                buffer = io.BytesIO()
+                gdown.download(id=f.id, output=buffer, quiet=True, use_cookies=False)
+                with zipfile.ZipFile(buffer, 'r') as zf:
+                    extraer_capa_comunas(zf, TEMP_DIR / Path(f.path).with_suffix("")) # Extrae la capa de comunas
+            with ThreadPoolExecutor(max_workers=min(4, len(zips))) as executor:
+                list(executor.map(extraer_zip, zips)) # Propaga errores de descarga/extracción
+        else:
+            # Sin zips (ej: capa ya descomprimida en Drive): descarga la carpeta completa
+            gdown.download_folder(url=URL_DPA_DRIVE, output=str(TEMP_DIR), quiet=False, use_cookies=False, remaining_ok=True)
         if procesar_shp(TEMP_DIR): return # Si se procesa correctamente, termina la función
     except Exception as e:
         print(f"   ✘ Falló Drive: {e}")
@@ -207,12 +454,14 @@ def download_limites():
     try: # Descarga usando OSMnx
         print("   3)  Intento OpenStreetMap (Fallback)...")
         # Geocodificación inversa
-        gdf = ox.geocode_to_gdf(f"{COMUNA_OBJETIVO}, Chile")
+        gdf = con_reintentos(ox.geocode_to_gdf, f"{COMUNA_OBJETIVO}, Chile")
         gdf = gdf.to_crs("EPSG:32719") # Reproyectar a UTM 19S
-        # Limpieza de columnas complejas incompatibles con GPKG
-        drop_cols = [c for c in gdf.columns if isinstance(gdf[c].iloc[0], list)]
-        # Guardar resultado como GeoPackage
-        gdf.drop(columns=drop_cols).to_file(output_file, driver="GPKG")
+        # Solo el nombre y la geometría (como con la DPA): el resto de columnas de
+        # Nominatim (ids, bbox, clases, ...) no se usa, y así tampoco quedan columnas
+        # de listas/dict incompatibles con GPKG que revisar
+        gdf = gdf[[c for c in ("name",) if c in gdf.columns] + ["geometry"]]
+        # Guardar resultado como GeoPackage (un solo polígono: sin índice espacial)
+        gdf.to_file(output_file, driver="GPKG", use_arrow=True, layer_options=GPKG_SIN_INDICE)
         print(f"   ✔ Guardado (OSM) en: {output_file.name}")
         log_metadata("limite_comuna.gpkg", "OpenStreetMap", "Geocode Fallback")
     except Exception as e:
@@ -224,53 +473,87 @@ def download_limites():
 def download_censo():
     """
     Descripción: Descarga las manzanas censales (Censo 2017) desde la API de ArcGIS del INE.
-                 Filtra por nombre de comuna y reproyecta a UTM 19S.
+                 Filtra por nombre de comuna y la obtiene ya proyectada en UTM 19S.
     
-    Salidas: None: Genera archivo 'manzanas_censales.shp'
+    Salidas: None: Genera archivo 'manzanas_censales.gpkg'
     """
-    output_file = VECTOR_DIR / "manzanas_censales.shp" # Archivo de salida para manzanas censales
+    output_file = VECTOR_DIR / "manzanas_censales.gpkg" # Archivo de salida para manzanas censales
     # Verifica si el archivo ya existe para evitar trabajo duplicado
     if output_file.exists(): # Si el archivo ya existe, salta la descarga
         print("✔ [INE] Manzanas censales ya existen. Saltando...")
-        log_metadata("manzanas_censales.shp", "INE / API ArcGIS", "Censo 2017 - Manzanas")
+        log_metadata("manzanas_censales.gpkg", "INE / API ArcGIS", "Censo 2017 - Manzanas")
         return
     # Inicia el proceso de descarga
     print("\n➤ Iniciando descarga de MANZANAS CENSALES (INE)...")
-    # Probar variaciones del nombre (con/sin tildes) para la API
-    nombres = [COMUNA_OBJETIVO.upper(), normalize(COMUNA_OBJETIVO)]
-    # Por cada variación del nombre de la ciudad, intentar descargar
-    for nombre in nombres:
-        print(f"    Buscando '{nombre}' en API ArcGIS...") # Busca el nombre en la API (Viña del Mar)
-        # Configuración de la consulta REST API
-        params = {
-            "where": f"UPPER(COMUNA) LIKE '{nombre}%'", # Filtro SQL
-            "outFields": "*", # Todos los campos
-            "returnGeometry": "true", # Incluir geometría
-            "f": "geojson", # Formato de retorno
-            "outSR": "4326" # CRS de salida WGS84
-        }
-        try: # Realiza la solicitud HTTP GET
-            # Solicitud a la API
-            r = requests.get(f"{URL_CENSO_API.rstrip('/')}/query", params=params, timeout=60)
-            if r.status_code != 200: continue # Si no es 200 OK, continua
-            # Procesa la respuesta JSON
-            data = r.json()
-            if data.get('features'): # Si hay características en la respuesta
-                count = len(data['features']) # Cuenta cuántas manzanas se descargaron
-                print(f"   ✔ Encontradas {count} manzanas.")
-                # Crea GeoDataFrame desde JSON
-                gdf = gpd.GeoDataFrame.from_features(data["features"])
-                gdf.set_crs(epsg=4326, inplace=True) # Establece CRS WGS84
-                # Reproyecta a UTM 19S (EPSG:32719)
-                print("    Reproyectando a UTM 19S...")
-                gdf = gdf.to_crs("EPSG:32719")
-                # Guarda como Shapefile
-                gdf.to_file(output_file, driver="ESRI Shapefile")
-                print(f"   ✔ Guardado en: {output_file.name}") # Mensaje de éxito
-                log_metadata("manzanas_censales.shp", "INE / API ArcGIS", "Censo 2017 - Manzanas")
-                return
-        except Exception as e: # En caso de error, indica el problema
-            print(f"    Error parcial: {e}")
+    # Una sola consulta válida con y sin tildes en el origen: cada letra no ASCII
+    # (ej: 'Ñ') se reemplaza por el comodín de un carácter '_' del LIKE, en vez de
+    # probar una consulta por cada variación del nombre
+    patron = "".join(c if c.isascii() else "_" for c in COMUNA_OBJETIVO.upper())
+    print(f"    Buscando '{patron}' en API ArcGIS...") # Busca el nombre en la API (Viña del Mar)
+    # Configuración de la consulta REST API
+    params = {
+        "where": f"UPPER(COMUNA) LIKE '{patron}%'", # Filtro SQL
+        "outFields": CENSO_CAMPOS, # Solo los campos usados
+        "returnGeometry": "true", # Incluir geometría
+        "f": "geojson", # Formato de retorno
+        # CRS de salida UTM 19S: el servidor entrega las coordenadas ya proyectadas,
+        # sin reproyectar localmente cada vértice de cada manzana
+        "outSR": "32719"
+    }
+    url_query = f"{URL_CENSO_API.rstrip('/')}/query" # Endpoint de consulta
+    try: # Realiza la solicitud HTTP GET
+        # 1) Solo el conteo de manzanas (respuesta pequeña, sin geometrías)
+        r = SESSION.get(url_query, params={"where": params["where"], "returnCountOnly": "true", "f": "json"}, timeout=60)
+        r.raise_for_status() # Lanza error si la respuesta no es 200 OK
+        total = r.json().get("count", 0)
+
+        # 2) Metadatos de la capa: campo identificador (para ordenar las páginas) y
+        # máximo de entidades por respuesta del servicio (maxRecordCount)
+        r = SESSION.get(URL_CENSO_API, params={"f": "json"}, timeout=60)
+        r.raise_for_status()
+        capa = r.json()
+        campo_id = capa.get("objectIdField", "OBJECTID")
+        pagina = min(CENSO_PAGINA, capa.get("maxRecordCount") or CENSO_PAGINA)
+
+        # 3) Descarga paginada: el servidor limita las entidades por respuesta
+        # (y trunca en silencio), así que se piden páginas de a lo más maxRecordCount
+        # entidades, ordenadas por el identificador (sin orden, resultOffset no
+        # garantiza páginas disjuntas), varias a la vez para solapar las esperas de red.
+        # Cada página GeoJSON se lee directo desde los bytes de la respuesta con
+        # pyogrio (GDAL + Arrow), en vez de parsearla con json y armar el
+        # GeoDataFrame entidad por entidad con from_features
+        def descargar_pagina(offset):
+            r = SESSION.get(url_query, params={**params, "orderByFields": campo_id,
+                                               "resultOffset": offset, "resultRecordCount": pagina}, timeout=60)
+            r.raise_for_status() # Lanza error si la respuesta no es 200 OK
+            return gpd.read_file(io.BytesIO(r.content), engine="pyogrio", use_arrow=True)
+        with ThreadPoolExecutor(max_workers=CENSO_HILOS) as executor:
+            paginas = [p for p in executor.map(descargar_pagina, range(0, total, pagina)) if len(p)]
+        # Verifica que llegaron todas las manzanas contadas (una página truncada por el
+        # servidor no arroja error): si faltan, no se guarda un resultado incompleto
+        descargadas = sum(len(p) for p in paginas)
+        if descargadas != total:
+            raise ValueError(f"Descarga incompleta: {descargadas} de {total} manzanas")
+        if paginas: # Si hay características en la respuesta
+            # Une las páginas (en orden) en un solo GeoDataFrame, con el CRS pedido (outSR)
+            # asignado explícitamente (el GeoJSON se asume en WGS84 al leerlo)
+            gdf = gpd.GeoDataFrame(pd.concat(paginas, ignore_index=True)).set_crs("EPSG:32719", allow_override=True)
+            # Verificación exacta (el comodín '_' acepta cualquier letra): nombre
+            # normalizado con las operaciones de texto de pandas, igual que en procesar_shp
+            nombres = (gdf["COMUNA"].astype("string").str.normalize("NFKD")
+                       .str.encode("ascii", "ignore").str.decode("ascii").str.upper())
+            gdf = gdf[nombres.str.startswith(normalize(COMUNA_OBJETIVO), na=False)]
+        if paginas and not gdf.empty:
+            count = len(gdf) # Cuenta cuántas manzanas se descargaron
+            print(f"   ✔ Encontradas {count} manzanas.")
+            # Guarda como GeoPackage: un solo archivo, sin truncar los nombres de
+            # columna a 10 caracteres (como el Shapefile) y escritura columnar con pyogrio
+            gdf.to_file(output_file, driver="GPKG", use_arrow=True)
+            print(f"   ✔ Guardado en: {output_file.name}") # Mensaje de éxito
+            log_metadata("manzanas_censales.gpkg", "INE / API ArcGIS", "Censo 2017 - Manzanas")
+            return
+    except Exception as e: # En caso de error, indica el problema
+        print(f"    Error: {e}")
     print("   ✘ ERROR: No se pudieron descargar manzanas.")
 
 # ==============================================================================
@@ -279,30 +562,43 @@ def download_censo():
 def download_red_vial():
     """
     Descripción: Descarga la red vial transitable (calles) usando OpenStreetMap (OSMnx).
-                 Y guarda el resultado como GeoJSON.
+                 Y guarda el resultado como GeoPackage.
     
-    Salidas: None: Genera archivo 'red_vial.geojson'
+    Salidas: None: Genera archivo 'red_vial.gpkg'
     """
-    output_file = VECTOR_DIR / "red_vial.geojson" # Archivo de salida para la red vial
+    output_file = VECTOR_DIR / "red_vial.gpkg" # Archivo de salida para la red vial
     if output_file.exists(): # Si el archivo ya existe, salta la descarga
         print("✔ [OSM] Red vial ya existe. Saltando...")
-        log_metadata("red_vial.geojson", "OpenStreetMap (OSMnx)", "Red vial (drive)")
+        log_metadata("red_vial.gpkg", "OpenStreetMap (OSMnx)", "Red vial (drive)")
         return
 
     print("\n➤ Iniciando descarga de RED VIAL (OSM)...")
     try: # Intenta descargar la red vial de Viña del Mar
         print(f"    Descargando calles de '{COMUNA_OBJETIVO}'...")
-        # Descarga el grafo de calles tipo 'drive' (vehículos)
-        graph = ox.graph_from_place(f"{COMUNA_OBJETIVO}, Chile", network_type="drive")
+        if GRAFO_RED_VIAL.exists(): # Grafo de una ejecución anterior (si falló al guardar)
+            print("    Usando grafo guardado en caché...")
+            graph = ox.load_graphml(GRAFO_RED_VIAL)
+        else:
+            # Descarga el grafo de calles tipo 'drive' (vehículos) dentro de la extensión de
+            # la comuna: una consulta Overpass por rectángulo (oeste, sur, este, norte), en vez
+            # de geocodificar el nombre y consultar por el polígono irregular de la comuna.
+            # Incluye los bordes de las comunas vecinas dentro del rectángulo (la app ya
+            # filtra la red vial por la extensión del límite comunal)
+            graph = con_reintentos(ox.graph_from_bbox, BBOX_COMUNA, network_type="drive")
+            # Guarda el grafo antes de procesarlo, para no repetir la consulta a Overpass
+            ox.save_graphml(graph, GRAFO_RED_VIAL)
         # Convierte el grafo en GeoDataFrame
         gdf_edges = ox.graph_to_gdfs(graph, nodes=False, edges=True)
         # Asegurar proyección UTM
         if gdf_edges.crs.to_string() != "EPSG:32719":
              gdf_edges = gdf_edges.to_crs("EPSG:32719")
-        # Guarda como GeoJSON
-        gdf_edges.to_file(output_file, driver="GeoJSON")
+        # Atributos de OSM con varios valores por tramo (ej: osmid, name, highway) a texto
+        gdf_edges = serializar_columnas_complejas(gdf_edges)
+        # Guarda como GeoPackage: geometría binaria (WKB) en vez de texto JSON por
+        # coordenada, archivo más pequeño y escritura más rápida con pyogrio
+        gdf_edges.to_file(output_file, driver="GPKG", use_arrow=True)
         print(f"   ✔ Guardado en: {output_file.name}") # Mensaje de éxito
-        log_metadata("red_vial.geojson", "OpenStreetMap (OSMnx)", "Red vial (drive)")
+        log_metadata("red_vial.gpkg", "OpenStreetMap (OSMnx)", "Red vial (drive)")
     except Exception as e: # En caso de error, indica problema
         print(f"   ✘ Error descargando red vial: {e}")
 
@@ -323,9 +619,18 @@ if __name__ == "__main__":
     mode = args.sources.lower() # Modo de descarga (todo o específico)
     print(f"➤ Ejecutando descarga de vectores. Modo: {mode.upper()}")
     # Lógica de ejecución condicional
-    if mode == "all" or mode == "ide": download_limites() # Descargar límites comunales
-    if mode == "all" or mode == "ine": download_censo() # Descargar manzanas censales
-    if mode == "all" or mode == "osm": download_red_vial() # Descargar red vial
+    modulos = []
+    if mode == "all" or mode == "ide": modulos.append(download_limites) # Descargar límites comunales
+    if mode == "all" or mode == "ine": modulos.append(download_censo) # Descargar manzanas censales
+    if mode == "all" or mode == "osm": modulos.append(download_red_vial) # Descargar red vial
+    # Las tres fuentes son independientes y están limitadas por la red, por lo
+    # que se descargan en paralelo (las esperas de conexión y transferencia se
+    # solapan). Dentro de cada módulo los respaldos siguen siendo secuenciales,
+    # ya que solo se intentan si falla la fuente anterior
+    if modulos:
+        with ThreadPoolExecutor(max_workers=len(modulos)) as executor:
+            for futuro in [executor.submit(m) for m in modulos]:
+                futuro.result() # Propaga excepciones no controladas
     cleanup_temp(force_create=False) # Limpieza final
     # Mensaje de finalización
     print(f"\n✔ ✔ Proceso finalizado. Metadatos en: {METADATA_FILE}")
\ No newline at end of file